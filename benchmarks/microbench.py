@@ -0,0 +1,336 @@
+"""Micro-benchmarks of the code that runs on every turn.
+
+Every benchmark measures the CPU time and the peak allocated bytes of one
+operation and compares them with benchmarks/baseline.json. The run fails
+when an operation is slower or allocates more than the threshold allows.
+
+CPU times are scaled by a calibration workload measured in the same run,
+so a machine that is slower than the one that recorded the baseline does
+not fail every benchmark, and a regression is measured again before it is
+reported.
+
+Usage (from the project root):
+    python -m benchmarks.microbench                      # compare with the baseline
+    python -m benchmarks.microbench --update-baseline    # record a new baseline
+    python -m benchmarks.microbench -k conversation      # only matching benchmarks
+"""
+from typing import Callable
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from src import LOCALES, Conversation
+from src.chat_modules import chatbot_api
+from src.chat_modules.chatbot_api import EchoChatBot
+from src.chat_modules.module_models import ModuleManager
+from src.i18n.i18n import I18nManager
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+I18N_DATABASE_PATH = "./src/i18n/strings.json"
+SYNTHETIC_PACKAGE = "bench_user_modules"
+CALIBRATION = "calibration"
+
+BENCHMARKS = {}
+_CLEANUPS = []
+# Scratch directory of the running benchmark, set by run()
+_TMP_DIR = None
+
+
+def benchmark(name: str, number: int = 1000):
+    """Register a benchmark.
+
+    The decorated function prepares the state and returns the callable
+    to be measured.
+
+    Args:
+        name (str): Name of the benchmark in the baseline file.
+        number (int, optional): Calls per measure. Defaults to 1000.
+    """
+    def decorator(func: Callable):
+        BENCHMARKS[name] = (func, number)
+        return func
+    return decorator
+
+
+def measure(operation: Callable, number: int, repeat: int = 9):
+    """Measure one operation.
+
+    Args:
+        operation (Callable): The operation.
+        number (int): Calls per measure.
+        repeat (int, optional): Measures, the median one is kept. Defaults to 9.
+
+    Returns:
+        dict: CPU nanoseconds per call, their spread (interquartile range)
+            and the peak allocated bytes per call.
+    """
+    operation()  # warm up caches and imports
+    samples = []
+    for _ in range(repeat):
+        start = time.process_time_ns()
+        for _ in range(number):
+            operation()
+        samples.append((time.process_time_ns() - start) / number)
+    quartiles = statistics.quantiles(samples, n=4)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ns": round(statistics.median(samples)),
+            "cpu_spread_ns": round(quartiles[2] - quartiles[0]),
+            "peak_bytes": peak - base}
+
+
+@benchmark(CALIBRATION, number=2000)
+def _bench_calibration():
+    # Plain interpreter work that none of the code changes touch, it measures the machine
+    def operation():
+        return sorted(str(i) for i in range(100))
+    return operation
+
+
+def _conversation_with_history(turns: int, size: int):
+    # At the limit every new message drops the oldest one, the steady state of a long chat
+    conversation = Conversation(LOCALES, limit=turns + 1)
+    for i in range(turns):
+        conversation.add_human_message(f"{i} " + "x" * size)
+    return conversation
+
+
+for _turns in (1, 10, 100):
+    for _size in (10, 1000):
+        @benchmark(f"conversation.add_human_message[turns={_turns},size={_size}]", number=2000)
+        def _bench_add_human_message(turns=_turns, size=_size):
+            conversation = _conversation_with_history(turns, size)
+            message = "y" * size
+            return lambda: conversation.add_human_message(message)
+
+        @benchmark(f"conversation.make_prompt[turns={_turns},size={_size}]", number=2000)
+        def _bench_make_prompt(turns=_turns, size=_size):
+            return _conversation_with_history(turns, size).make_prompt
+
+        @benchmark(f"conversation.fork[turns={_turns},size={_size}]", number=2000)
+        def _bench_fork(turns=_turns, size=_size):
+            # Only the divergent turn should cost memory, whatever the shared history
+            conversation = _conversation_with_history(turns, size)
+            message = "z" * size
+            return lambda: conversation.fork().add_ia_message(message)
+
+
+class _StubQueryBot(EchoChatBot):
+    """Echo backend whose answer picks the indices to discard."""
+
+    def chatbot_query(self, message):
+        return {"message": "Bot: Descartaria las opciones 2 y 3, luego la 2 otra vez."}
+
+
+@benchmark("chatbot.dynamic_zero_shot_context_value_discard[turns=10]", number=2000)
+def _bench_discard():
+    bot = _StubQueryBot(LOCALES)
+    history = [f"Human: message {i}" for i in range(10)]
+    return lambda: bot.dynamic_zero_shot_context_value_discard(list(history), 2)
+
+
+def _write_synthetic_modules(root: str, count: int):
+    """Write `count` user modules shaped like src/user_modules/example."""
+    package = os.path.join(root, SYNTHETIC_PACKAGE)
+    for i in range(count):
+        module_dir = os.path.join(package, f"module_{i}")
+        os.makedirs(module_dir)
+        with open(os.path.join(module_dir, "main.py"), "w") as f:
+            f.write(
+                f'META_MODULE_NAME = "Synthetic {i}"\n'
+                'META_MODULE_VERSION = "1.0"\n'
+                'META_AUTHOR = "bench"\n'
+                f'DESCRIPTION_PROMPT = "Synthetic module number {i} for benchmarks"\n'
+                + "".join(
+                    f"def module_{kind}_{step}(*args):\n    return args\n"
+                    f"module_{kind}_{step}.priority = {step}\n"
+                    for kind in ("feature", "preprocess", "task") for step in range(2)))
+    return package
+
+
+def _purge_synthetic_imports():
+    for name in [n for n in sys.modules if n.split(".")[0] == SYNTHETIC_PACKAGE]:
+        del sys.modules[name]
+
+
+for _count in (1, 10, 100):
+    @benchmark(f"module_manager.startup[modules={_count}]", number=max(1, 100 // _count))
+    def _bench_module_manager_startup(count=_count):
+        package = _write_synthetic_modules(_TMP_DIR, count)
+
+        def operation():
+            _purge_synthetic_imports()
+            ModuleManager(module_locations=package, package=SYNTHETIC_PACKAGE)
+        return operation
+
+    @benchmark(f"module_manager.return_descriptions[modules={_count}]", number=2000)
+    def _bench_return_descriptions(count=_count):
+        package = _write_synthetic_modules(_TMP_DIR, count)
+        _purge_synthetic_imports()
+        return ModuleManager(module_locations=package, package=SYNTHETIC_PACKAGE).return_descriptions
+
+    @benchmark(f"module_manager.reload_one[modules={_count}]", number=max(1, 100 // _count))
+    def _bench_reload_one(count=_count):
+        # Reload time when one module out of `count` changed on disk
+        package = _write_synthetic_modules(_TMP_DIR, count)
+        _purge_synthetic_imports()
+        manager = ModuleManager(module_locations=package, package=SYNTHETIC_PACKAGE)
+        changed_file = os.path.join(package, "module_0", "main.py")
+        mtime = [os.stat(changed_file).st_mtime_ns]
+
+        def operation():
+            mtime[0] += 1000
+            os.utime(changed_file, ns=(mtime[0], mtime[0]))
+            manager.reload_changed()
+        return operation
+
+
+    @benchmark(f"module_manager.return_descriptions_during_reload[modules={_count}]", number=2000)
+    def _bench_return_descriptions_during_reload(count=_count):
+        # A module whose import sleeps keeps a reload running the whole measure.
+        # The sleep releases the GIL so the reload costs no CPU time to the
+        # measure, and time spent waiting is not CPU time either: a reader
+        # that waits for the reload shows up as a reload finished too soon.
+        package = _write_synthetic_modules(_TMP_DIR, count)
+        _purge_synthetic_imports()
+        manager = ModuleManager(module_locations=package, package=SYNTHETIC_PACKAGE)
+        with open(os.path.join(package, "module_0", "main.py"), "a") as f:
+            f.write("import time\ntime.sleep(0.5)\n")
+        reloader = threading.Thread(target=manager.reload_changed, daemon=True)
+        reloader.start()
+        time.sleep(0.05)
+
+        def check_and_join():
+            still_running = reloader.is_alive()
+            reloader.join()
+            if not still_running:
+                raise RuntimeError("return_descriptions waited for the reload to finish")
+        _CLEANUPS.append(check_and_join)
+        return manager.return_descriptions
+
+
+@benchmark("i18n.load", number=200)
+def _bench_i18n_load():
+    return lambda: I18nManager(I18N_DATABASE_PATH, "en")
+
+
+@benchmark("i18n.lookup", number=20000)
+def _bench_i18n_lookup():
+    locales = I18nManager(I18N_DATABASE_PATH, "en")
+    return lambda: locales["bot_output"]
+
+
+def run(selection: str = None, names: list = None):
+    """Run the benchmarks whose name contains `selection`, the calibration always runs.
+
+    Args:
+        selection (str, optional): Text the names must contain. Defaults to every benchmark.
+        names (list, optional): Exact names to run instead of a selection.
+
+    Returns:
+        dict: Results per benchmark name.
+    """
+    global _TMP_DIR
+    results = {}
+    # The discard benchmark must not wait on the API throttle
+    chatbot_api_sleep = chatbot_api.sleep
+    chatbot_api.sleep = lambda seconds: None
+    try:
+        for name, (factory, number) in BENCHMARKS.items():
+            if name != CALIBRATION and (names is not None and name not in names
+                                        or names is None and selection and selection not in name):
+                continue
+            _TMP_DIR = tempfile.mkdtemp(prefix="microbench-")
+            sys.path.insert(0, _TMP_DIR)
+            try:
+                results[name] = measure(factory(), number)
+            finally:
+                while _CLEANUPS:
+                    _CLEANUPS.pop()()
+                sys.path.remove(_TMP_DIR)
+                _purge_synthetic_imports()
+                shutil.rmtree(_TMP_DIR, ignore_errors=True)
+                _TMP_DIR = None
+            print(f"{name:<65} {results[name]['cpu_ns']:>12} ns {results[name]['peak_bytes']:>10} B")
+    finally:
+        chatbot_api.sleep = chatbot_api_sleep
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Return the names of the benchmarks slower or bigger than the baseline allows, with the reasons."""
+    regressions = {}
+    speed = 1.0
+    if CALIBRATION in results and CALIBRATION in baseline:
+        speed = results[CALIBRATION]["cpu_ns"] / baseline[CALIBRATION]["cpu_ns"]
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or name == CALIBRATION:
+            continue
+        for metric in ("cpu_ns", "peak_bytes"):
+            if metric == "cpu_ns":
+                # Tiny values are dominated by noise, give them slack for the measured spread
+                expected = reference[metric] * speed
+                slack = 200 + 4 * max(result.get("cpu_spread_ns", 0), reference.get("cpu_spread_ns", 0))
+            else:
+                expected = reference[metric]
+                slack = 256
+            if result[metric] > expected * (1 + threshold) + slack:
+                regressions.setdefault(name, []).append(
+                    f"{name} {metric}: {result[metric]} > {round(expected)} (+{threshold:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="selection", help="only run benchmarks containing this text")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=1.0,
+                        help="allowed relative regression, 1.0 means twice as slow (default)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = run(args.selection)
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline first")
+        return 1
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        # A busy machine can slow one measure down, only report what fails twice
+        print(f"Measuring {len(regressions)} regressions again")
+        regressions = compare(run(names=list(regressions)), baseline, args.threshold)
+    for reasons in regressions.values():
+        for reason in reasons:
+            print(f"REGRESSION {reason}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
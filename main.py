@@ -6,4 +6,8 @@ from src.chat_modules.prompt_manager import PromptManager
 chat = YouChat(os.environ['CHATAPI'], LOCALES, "Flancisco")
 promter = PromptManager(chat, LOCALES)
 
-#promter.chatbot_cli_mainloop()
\ No newline at end of file
+#promter.chatbot_cli_mainloop()
+# Network front-end, one session per connection:
+# import asyncio
+# from src.chat_modules.server import ChatServer
+# asyncio.run(ChatServer(chat, LOCALES, module_manager=promter.module_manager).serve_forever())
@@ -0,0 +1,239 @@
+"""Offline batch processing of JSONL conversation files.
+
+This module provides the BatchRunner class. It streams a JSONL file of
+sessions through a chatbot manager with a bounded pool of workers, writes
+one result line per session as soon as it is ready and keeps a checkpoint
+so an interrupted run resumes where it stopped.
+
+Every input line is a session, the turns are sent in order on a fresh
+conversation:
+
+    {"session_id": "a", "turns": ["Hello", "Write a script"]}
+    {"session_id": "b", "message": "Hi"}
+
+Every output line is the result of one input line:
+
+    {"line": 0, "session_id": "a", "replies": ["...", "..."]}
+    {"line": 1, "session_id": "b", "error": "..."}
+
+Usage:
+    python -m src.chat_modules.batch_runner sessions.jsonl results.jsonl --backend echo --workers 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from src.chat_modules.chatbot_api import BaseChatBotManager
+
+
+class BatchReport:
+    """Counters of a batch run.
+
+    Attributes:
+        sessions (int): Sessions processed in this run.
+        turns (int): Turns answered in this run.
+        errors (int): Sessions that failed.
+        skipped (int): Sessions already done by a previous run.
+        elapsed (float): Seconds spent in this run.
+    """
+
+    def __init__(self):
+        """Init the counters."""
+        self.sessions = 0
+        self.turns = 0
+        self.errors = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    @property
+    def sessions_per_second(self):
+        """float: Sessions processed per second."""
+        return self.sessions / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def turns_per_second(self):
+        """float: Turns answered per second."""
+        return self.turns / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        """Return a one line summary."""
+        return (f"{self.sessions} sessions ({self.errors} errors, {self.skipped} skipped), "
+                f"{self.turns} turns in {self.elapsed:.1f}s: "
+                f"{self.sessions_per_second:.2f} sessions/s, {self.turns_per_second:.2f} turns/s")
+
+
+class BatchRunner:
+    """Run every session of a JSONL file through a chatbot manager.
+
+    Only the lines in flight are kept in memory, so memory stays constant
+    whatever the size of the input. A line is only submitted when it is
+    less than two lines per worker ahead of the first line not done yet,
+    so a slow session cannot make the done lines pile up behind it. The
+    checkpoint stores the first line not done yet and the done lines after
+    it. Results are written before the checkpoint, so a crash can repeat
+    the sessions finished since the last checkpoint but never loses one.
+
+    Args:
+        chatbot (BaseChatBotManager): Chatbot manager shared by the workers.
+        input_path (str): JSONL file of sessions.
+        output_path (str): JSONL file of results, appended to on resume.
+        checkpoint_path (str, optional): Progress file. Defaults to
+            output_path + ".checkpoint".
+        workers (int, optional): Sessions processed at once. Defaults to 4.
+        n_best (int, optional): Candidates per turn, see
+            BaseChatBotManager.generate. Defaults to 1.
+        report_every (float, optional): Seconds between progress lines,
+            0 disables them. Defaults to 10.
+    """
+
+    def __init__(self, chatbot: BaseChatBotManager, input_path: str, output_path: str,
+                 checkpoint_path: str = None, workers: int = 4, n_best: int = 1,
+                 report_every: float = 10.0):
+        """Init the runner, nothing is read until run is called."""
+        self.chatbot = chatbot
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+        self.workers = workers
+        self.n_best = n_best
+        self.report_every = report_every
+        self.report = BatchReport()
+
+        self.__progress = threading.Condition()
+        self.__next_line = 0
+        self.__done = set()
+        self.__failure = None
+
+    def run(self):
+        """Process every session not done yet.
+
+        Returns:
+            BatchReport: The counters of this run.
+        """
+        self.__load_checkpoint()
+        start = time.perf_counter()
+        last_report = start
+        # Bound how far ahead of the checkpoint we read, it also bounds the executor queue
+        window = self.workers * 2
+
+        with open(self.input_path, "r", encoding="utf-8") as source, \
+                open(self.output_path, "a", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for number, line in enumerate(source):
+                with self.__progress:
+                    if number < self.__next_line or number in self.__done:
+                        self.report.skipped += 1
+                        continue
+                    self.__progress.wait_for(
+                        lambda n=number: n - self.__next_line < window or self.__failure is not None)
+                if self.__failure is not None:
+                    break
+                if not line.strip():
+                    self.__finish(number, None, output)
+                    continue
+                future = executor.submit(self.__process, number, line)
+                future.add_done_callback(lambda f, n=number: self.__on_done(n, f, output))
+
+                if self.report_every and time.perf_counter() - last_report >= self.report_every:
+                    last_report = time.perf_counter()
+                    self.report.elapsed = last_report - start
+                    print(self.report, file=sys.stderr)
+
+        self.report.elapsed = time.perf_counter() - start
+        if self.__failure is not None:
+            raise self.__failure
+        return self.report
+
+    def __process(self, number: int, line: str):
+        """Run one session, returns its result line."""
+        session = None
+        try:
+            session = json.loads(line)
+            turns = session["turns"] if "turns" in session else [session["message"]]
+            conversation = self.chatbot.new_conversation()
+            replies = [self.chatbot.generate(turn, conversation, n_best=self.n_best) for turn in turns]
+        except Exception as error:
+            session_id = session.get("session_id") if isinstance(session, dict) else None
+            return {"line": number, "session_id": session_id,
+                    "error": f"{type(error).__name__}: {error}"}
+        return {"line": number, "session_id": session.get("session_id"), "replies": replies}
+
+    def __on_done(self, number: int, future, output):
+        """Write the result of a session."""
+        # Session errors are results, anything else (e.g. KeyboardInterrupt) stops the run
+        failure = future.exception()
+        if failure is None:
+            self.__finish(number, future.result(), output)
+            return
+        with self.__progress:
+            self.__failure = failure
+            self.__progress.notify_all()
+
+    def __finish(self, number: int, result, output):
+        """Write a result and move the checkpoint forward."""
+        with self.__progress:
+            if result is not None:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output.flush()
+                self.report.sessions += 1
+                if "error" in result:
+                    self.report.errors += 1
+                else:
+                    self.report.turns += len(result["replies"])
+            self.__done.add(number)
+            while self.__next_line in self.__done:
+                self.__done.remove(self.__next_line)
+                self.__next_line += 1
+            self.__save_checkpoint()
+            self.__progress.notify_all()
+
+    def __load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("input") != os.path.abspath(self.input_path):
+            raise ValueError(f"{self.checkpoint_path} belongs to another input file")
+        self.__next_line = checkpoint["next_line"]
+        self.__done = set(checkpoint["done"])
+
+    def __save_checkpoint(self):
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"input": os.path.abspath(self.input_path),
+                       "next_line": self.__next_line, "done": sorted(self.__done)}, f)
+        os.replace(temporary, self.checkpoint_path)
+
+
+def main(argv=None):
+    """Command line entry point, the API keys come from the CHATAPI variable like main.py."""
+    from src import LOCALES
+    from src.chat_modules.chatbot_api import BLOOMInferenceAPI, EchoChatBot, YouChat
+
+    parser = argparse.ArgumentParser(description="Run a JSONL file of sessions through the chatbot.")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--backend", choices=("echo", "youchat", "bloom"), default="echo")
+    parser.add_argument("--checkpoint")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--n-best", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.backend == "echo":
+        chatbot = EchoChatBot(LOCALES)
+    elif args.backend == "youchat":
+        chatbot = YouChat(os.environ['CHATAPI'], LOCALES)
+    else:
+        chatbot = BLOOMInferenceAPI(os.environ['CHATAPI'], LOCALES, batch_size=args.workers)
+
+    runner = BatchRunner(chatbot, args.input, args.output, args.checkpoint,
+                         workers=args.workers, n_best=args.n_best)
+    print(runner.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Micro-batching of concurrent chatbot queries.
+
+This module provides the MicroBatcher class. Callers from many threads
+submit one prompt each, a background thread gathers the prompts for up to
+`max_wait` seconds or `max_batch` items and sends them as a single request,
+then every caller gets its own response back.
+
+Usage:
+```python
+batcher = MicroBatcher(chatbot.chatbot_query_batch, max_batch=16, max_wait=0.005)
+response = batcher.submit("Hello")
+batcher.close()
+```
+"""
+from concurrent.futures import Future
+from typing import Callable
+import queue
+import threading
+import time
+
+
+class BatchMetrics:
+    """Counters of a MicroBatcher.
+
+    Attributes:
+        batches (int): Requests sent to the backend.
+        items (int): Prompts sent to the backend.
+        full_batches (int): Batches closed because they reached max_batch.
+        max_batch (int): Configured batch size.
+    """
+
+    def __init__(self, max_batch: int):
+        """Init the counters.
+
+        Args:
+            max_batch (int): Configured batch size.
+        """
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+
+    @property
+    def mean_batch_size(self):
+        """float: Average number of prompts per request."""
+        return self.items / self.batches if self.batches else 0.0
+
+    @property
+    def fill_ratio(self):
+        """float: Average fraction of max_batch used by each request."""
+        return self.mean_batch_size / self.max_batch
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {"batches": self.batches, "items": self.items,
+                "full_batches": self.full_batches,
+                "mean_batch_size": self.mean_batch_size,
+                "fill_ratio": self.fill_ratio}
+
+
+class MicroBatcher:
+    """Gather concurrent prompts into batched backend requests.
+
+    Args:
+        batch_function (Callable): Function that takes a list of prompts and
+            returns a list with one response per prompt, in order.
+        max_batch (int, optional): Prompts per request. Defaults to 8.
+        max_wait (float, optional): Seconds the first prompt of a batch waits
+            for company. Defaults to 0.005.
+    """
+
+    def __init__(self, batch_function: Callable, max_batch: int = 8, max_wait: float = 0.005):
+        """Init the batcher and start its worker thread."""
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        self.batch_function = batch_function
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.metrics = BatchMetrics(max_batch)
+
+        self.__queue = queue.Queue()
+        self.__closed = False
+        self.__state_lock = threading.Lock()
+        self.__worker = threading.Thread(target=self.__run, name="micro-batcher", daemon=True)
+        self.__worker.start()
+
+    def submit(self, prompt):
+        """Queue a prompt and block until its response is ready.
+
+        Args:
+            prompt (str): The prompt.
+
+        Returns:
+            Any: The response of the backend for that prompt.
+        """
+        return self.submit_async(prompt).result()
+
+    def submit_async(self, prompt):
+        """Queue a prompt without waiting.
+
+        Args:
+            prompt (str): The prompt.
+
+        Returns:
+            Future: Resolves to the response of the backend for that prompt.
+        """
+        future = Future()
+        # Nothing may be queued after the stop sentinel, it would never be answered
+        with self.__state_lock:
+            if self.__closed:
+                raise RuntimeError("The batcher is closed")
+            self.__queue.put((prompt, future))
+        return future
+
+    def close(self):
+        """Send the queued prompts and stop the worker thread."""
+        with self.__state_lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__queue.put(None)
+        self.__worker.join()
+
+    def __run(self):
+        """Worker thread, whatever stops it no caller is left waiting."""
+        try:
+            self.__gather_batches()
+        finally:
+            with self.__state_lock:
+                self.__closed = True
+            while True:
+                try:
+                    item = self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].set_exception(RuntimeError("The batcher is closed"))
+
+    def __gather_batches(self):
+        """Worker loop, gathers one batch at a time and sends it."""
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.__queue.get(timeout=timeout) if timeout > 0 else self.__queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self.__send(batch)
+            if stop:
+                return
+
+    def __send(self, batch):
+        """Send one batch and hand every response to its caller."""
+        self.metrics.batches += 1
+        self.metrics.items += len(batch)
+        if len(batch) == self.max_batch:
+            self.metrics.full_batches += 1
+
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            responses = self.batch_function(prompts)
+            if len(responses) != len(prompts):
+                raise ValueError(f"Expected {len(prompts)} responses, got {len(responses)}")
+        except BaseException as error:
+            # Even a BaseException only fails this batch, the worker keeps serving
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), response in zip(batch, responses):
+            future.set_result(response)
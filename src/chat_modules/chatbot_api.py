@@ -1,5 +1,8 @@
 """All chatbot classes are coded here."""
 from src import Conversation
+from src.chat_modules.batching import MicroBatcher
+from src.chat_modules.reranking import BaseReranker, HeuristicReranker, NBestMetrics
+from concurrent.futures import ThreadPoolExecutor
 from youdotcom import Chat
 from time import sleep
 import re
@@ -21,15 +24,39 @@ class BaseChatBotManager:
     :param discard_method: An optional string specifying the method to discard old messages from the conversation history. Defaults to None
     :param discard_beams: An optional integer specifying how many beams to discard when using lifo method. Defaults to 1.
     :type discard_beams: int
+    :param max_parallel_queries: An optional integer, the n-best candidate queries in flight at once across every turn of this manager. Defaults to 8.
+    :type max_parallel_queries: int
     """
 
-    def __init__(self, use_context: bool, locales, limit: int = 10, ia_name="Bot", discard_method=None, discard_beams: int = 1):
+    def __init__(self, use_context: bool, locales, limit: int = 10, ia_name="Bot", discard_method=None, discard_beams: int = 1,
+                 max_parallel_queries: int = 8):
         if not use_context:
             raise AttributeError("Use context property is required.")
         self.use_context = use_context
+        self.limit = limit
+        self.ia_name = ia_name
+        self.discard_method = discard_method
+        self.discard_beams = discard_beams
+        self.n_best_metrics = NBestMetrics()
+        # Shared by every turn, so concurrent n-best turns cannot multiply the load on the backend
+        self.query_executor = ThreadPoolExecutor(max_workers=max_parallel_queries, thread_name_prefix="n-best")
 
-        if self.use_context is None:
-            self.context = Conversation(limit=limit, ia_name=ia_name, locales=locales, discard_method=discard_method, discard_beams=discard_beams)
+        if self.use_context:
+            self.context = self.new_conversation(locales)
+
+    def new_conversation(self, locales=None):
+        """A method to create a fresh conversation with this manager settings.
+
+        This is used to give every session its own context while sharing the same chatbot manager.
+
+        :param locales: An optional I18nManager for the conversation. Defaults to the manager locales.
+        :type locales: I18nManager
+        :return: A new conversation instance.
+        :rtype: Conversation
+        """
+        return Conversation(limit=self.limit, ia_name=self.ia_name,
+                            locales=locales if locales is not None else self.locales,
+                            discard_method=self.discard_method, discard_beams=self.discard_beams)
 
     def chatbot_query(self, message):
         """A method to query the chatbot with a given message.
@@ -44,17 +71,47 @@ class BaseChatBotManager:
         """
         raise NotImplementedError("This is a base class")
 
+    def chatbot_query_candidate(self, message):
+        """A method to query one of the candidates of an n-best turn.
+
+        Every candidate gets the same prompt, so backends that decode deterministically should override this method to sample, or all the candidates will be the same.
+
+        :param message: A string representing the user input.
+        :type message: str
+        :return: A string representing the chatbot response.
+        :rtype: str
+        """
+        return self.chatbot_query(message)
+
+    def chatbot_query_batch(self, messages):
+        """A method to query the chatbot with many messages at once.
+
+        Subclasses whose API accepts a list of inputs should override this method to send a single request.
+
+        :param messages: A list of strings representing the user inputs.
+        :type messages: list
+        :return: A list with one chatbot response per message, in order.
+        :rtype: list
+        """
+        return [self.chatbot_query(message) for message in messages]
+
     def preprocess(self, response):
 
         raise NotImplementedError("This is a base class")
 
-    def generate(self, message):
+    def generate(self, message, context=None, n_best: int = 1, reranker: BaseReranker = None):
         """A method to preprocess the chatbot response before returning it.
 
         This method should be implemented by subclasses to perform any necessary preprocessing on the response, such as formatting, spelling correction, etc.
 
         :param response: A string representing the chatbot response.
         :type response: str
+        :param context: An optional conversation to use instead of the manager context, one per session.
+        :type context: Conversation
+        :param n_best: An optional integer, the number of candidates queried concurrently for this turn. Defaults to 1.
+        :type n_best: int
+        :param reranker: An optional reranker that picks the candidate committed to the conversation. Defaults to a HeuristicReranker.
+        :type reranker: BaseReranker
         :return: A string representing the preprocessed chatbot response.
         :rtype: str
         :raises NotImplementedError: If the method is not implemented by a subclass.
@@ -62,15 +119,50 @@ class BaseChatBotManager:
 
         #TODO: catch json decode error
         if self.use_context:
-            self.context.add_human_message(message)
-            curr_message = self.chatbot_query(self.context.make_prompt())
+            context = context if context is not None else self.context
+            if n_best > 1:
+                return self.__generate_n_best(message, context, n_best, reranker)
+            context.add_human_message(message)
+            curr_message = self.chatbot_query(context.make_prompt())
             message = self.preprocess(curr_message)
-            self.context.add_ia_message(message)
+            context.add_ia_message(message)
             return message
         else:
             curr_message = self.chatbot_query(message)
             return curr_message
-        
+
+    def __generate_n_best(self, message, context, n_best, reranker):
+        """Query n_best candidates at once and commit the best one to the context.
+
+        The turn runs on a fork of the context, so nothing is committed if every candidate fails.
+        """
+        reranker = reranker if reranker is not None else HeuristicReranker(context.locales)
+        branch = context.fork()
+        branch.add_human_message(message)
+        prompt = branch.make_prompt()
+
+        futures = [self.query_executor.submit(self.chatbot_query_candidate, prompt) for _ in range(n_best)]
+        candidates = []
+        queries = []
+        errors = []
+        for query, future in enumerate(futures):
+            try:
+                candidates.append(self.preprocess(future.result()))
+                queries.append(query)
+            except Exception as error:
+                errors.append(error)
+        if not candidates:
+            self.n_best_metrics.record(0, len(errors))
+            branch.discard()
+            raise errors[0]
+
+        winner = reranker.select(candidates, prompt)
+        # The metrics compare against the first query, not the first surviving candidate
+        self.n_best_metrics.record(len(candidates), len(errors), queries[winner])
+
+        branch.add_ia_message(candidates[winner])
+        branch.commit()
+        return candidates[winner]
     
     def dynamic_zero_shot_context_value_discard(self, history, num):
         """A method to discard old messages from the conversation history using a zero-shot classification model.
@@ -116,9 +208,16 @@ class BLOOMInferenceAPI(BaseChatBotManager):
     :type ia_name: str
     :param discard_beams: An optional integer specifying how many beams to discard when using lifo method. Defaults to 1.
     :type discard_beams: int
+    :param batch_size: An optional integer, when set concurrent queries are sent together in batches of up to this size. Defaults to None.
+    :type batch_size: int
+    :param batch_wait: An optional float with the seconds a query waits for others to fill its batch. Defaults to 0.005.
+    :type batch_wait: float
+    :param sampling_parameters: An optional dictionary of generation parameters for the n-best candidates. Defaults to sampling with temperature 0.9 and top_p 0.95.
+    :type sampling_parameters: dict
     """
 
-    def __init__(self, api_key, locales, ia_name="Beto", discard_beams=1):
+    def __init__(self, api_key, locales, ia_name="Beto", discard_beams=1, batch_size=None, batch_wait=0.005,
+                 sampling_parameters=None):
         """Init YouChat text generator model onto a conversational chatbot instance.
 
         This method initializes the BLOOMInferenceAPI class with the given parameters and calls the BaseChatBotManager constructor.
@@ -131,6 +230,12 @@ class BLOOMInferenceAPI(BaseChatBotManager):
         :type ia_name: str
         :param discard_beams: An optional integer specifying how many beams to discard when using lifo method. Defaults to 1.
         :type discard_beams: int
+        :param batch_size: An optional integer, when set concurrent queries are sent together in batches of up to this size. Defaults to None.
+        :type batch_size: int
+        :param batch_wait: An optional float with the seconds a query waits for others to fill its batch. Defaults to 0.005.
+        :type batch_wait: float
+        :param sampling_parameters: An optional dictionary of generation parameters for the n-best candidates. Defaults to sampling with temperature 0.9 and top_p 0.95.
+        :type sampling_parameters: dict
         """
         use_context = True
         self.locales = locales
@@ -145,6 +250,17 @@ class BLOOMInferenceAPI(BaseChatBotManager):
 
         self.api_url = "https://api-inference.huggingface.co/models/bigscience/bloom"
         self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        self.parameters = {"return_full_text": False}
+        # Greedy decoding gives the same reply to the same prompt, the candidates must sample
+        self.sampling_parameters = {**self.parameters,
+                                    **(sampling_parameters or {"do_sample": True, "temperature": 0.9, "top_p": 0.95})}
+        self.batcher = None
+        self.candidate_batcher = None
+        if batch_size:
+            self.batcher = MicroBatcher(self.chatbot_query_batch, max_batch=batch_size, max_wait=batch_wait)
+            self.candidate_batcher = MicroBatcher(
+                lambda messages: self.chatbot_query_batch(messages, self.sampling_parameters),
+                max_batch=batch_size, max_wait=batch_wait)
 
 
     def preprocess(self, response):
@@ -171,13 +287,53 @@ class BLOOMInferenceAPI(BaseChatBotManager):
         :rtype: dict
         :raises ConnectionError: If the BLOOM API is not available.
         """
+        if self.batcher is not None:
+            return self.batcher.submit(message)
+        return self.chatbot_query_batch([message])[0]
+
+    def chatbot_query_candidate(self, message):
+        """A method to query one of the candidates of an n-best turn with the sampling parameters.
+
+        :param message: A string representing the user input.
+        :type message: str
+        :return: A dictionary representing the chatbot response from the BLOOM API.
+        :rtype: dict
+        :raises ConnectionError: If the BLOOM API is not available.
+        """
+        if self.candidate_batcher is not None:
+            return self.candidate_batcher.submit(message)
+        return self.chatbot_query_batch([message], self.sampling_parameters)[0]
+
+    def chatbot_query_batch(self, messages, parameters=None):
+        """A method to query the chatbot with many messages in a single request.
+
+        The inference endpoint accepts a list of inputs, so the whole batch costs one HTTP request.
+
+        :param messages: A list of strings representing the user inputs.
+        :type messages: list
+        :param parameters: An optional dictionary of generation parameters. Defaults to the greedy parameters.
+        :type parameters: dict
+        :return: A list with one dictionary per message, in order.
+        :rtype: list
+        :raises ConnectionError: If the BLOOM API is not available.
+        """
+        parameters = parameters if parameters is not None else self.parameters
+        payload = {"inputs": messages if len(messages) > 1 else messages[0],
+                   "parameters": parameters}
+        if parameters.get("do_sample"):
+            # The endpoint caches answers by payload, a cached sample is the same for every candidate
+            payload["options"] = {"use_cache": False}
         try:
-            response = requests.post(self.api_url, headers=self.headers)
+            response = requests.post(self.api_url, headers=self.headers, json=payload).json()
         except requests.JSONDecodeError:
-            return {"message": self.locales['api_error_message']}
-        if response == "Service Temporarily Unavailable":
-            raise ConnectionError("The You Chat API isn't available")
-        return response
+            return [{"message": self.locales['api_error_message']} for _ in messages]
+        if isinstance(response, dict) and "error" in response:
+            raise ConnectionError(f"The BLOOM API isn't available: {response['error']}")
+        if len(messages) == 1:
+            response = [response]
+        # Each input yields a list of generations, we keep the first one
+        return [{"message": (generation[0] if isinstance(generation, list) else generation)["generated_text"]}
+                for generation in response]
 
 
 class YouChat(BaseChatBotManager):
@@ -251,3 +407,51 @@ class YouChat(BaseChatBotManager):
         if response == "Service Temporarily Unavailable":
             raise ConnectionError("The You Chat API isn't available")
         return response
+
+
+class EchoChatBot(BaseChatBotManager):
+    """A subclass of BaseChatBotManager that answers locally without any network access.
+
+    This class is a stub backend to run the server, the benchmarks or the batch jobs on localhost. It replies with the last line of the prompt and can simulate the upstream latency.
+
+    :param locales: A list of locales supported by the chatbot manager.
+    :type locales: list
+    :param ia_name: An optional string specifying the name of the chatbot. Defaults to "Echo".
+    :type ia_name: str
+    :param latency: An optional float with the seconds to wait before answering. Defaults to 0.
+    :type latency: float
+    :param max_parallel_queries: An optional integer, the n-best candidate queries in flight at once. Defaults to 8.
+    :type max_parallel_queries: int
+    """
+
+    def __init__(self, locales, ia_name="Echo", latency: float = 0.0, max_parallel_queries: int = 8):
+        use_context = True
+        self.locales = locales
+        self.latency = latency
+        BaseChatBotManager.__init__(self, use_context,
+                                    locales=locales,
+                                    ia_name=ia_name,
+                                    max_parallel_queries=max_parallel_queries)
+
+    def preprocess(self, response):
+        """A method to preprocess the chatbot response before returning it.
+
+        :param response: A dictionary representing the stub response.
+        :type response: dict
+        :return: A string representing the preprocessed chatbot response.
+        :rtype: str
+        """
+        message = response['message']
+        return message.replace("Bot:", "").strip()
+
+    def chatbot_query(self, message):
+        """A method to query the stub with a given message.
+
+        :param message: A string representing the user input.
+        :type message: str
+        :return: A dictionary with the last line of the message as response.
+        :rtype: dict
+        """
+        if self.latency:
+            sleep(self.latency)
+        return {"message": f"Bot: {message.splitlines()[-1] if message else ''}"}
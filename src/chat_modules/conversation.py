@@ -1,6 +1,10 @@
 """Module for context managers."""
 from typing import Callable
 
+# Nested divergences kept as shared segments before a branch flattens its history
+_MAX_SEGMENTS = 8
+
+
 class Conversation:
     """Manage the conversation between the agent and the bot.
 
@@ -11,6 +15,10 @@ class Conversation:
     conversation.make_prompt()
     # {context_string}
     # Human: hello
+
+    branch = conversation.fork()
+    branch.add_ia_message("Hi")
+    branch.commit()  # or branch.discard()
     ```
     """
 
@@ -24,11 +32,77 @@ class Conversation:
                 self identify as his name. Defaults to "Bot".
         """
         self.discard_beams = discard_beams
-        self.locales = locales 
+        self.locales = locales
         self.initial_story = self.locales["base_prompt"]["default_assistant_prompt"].format(bot_name=ia_name)
-        self.history = [self.initial_story]
         self.limit = limit
         self.discard_method = discard_method
+        self.parent = None
+        # The history is the shared read-only __prefix segments, each one a
+        # (list, start, end) view, followed by __turns[__start:__end]
+        self.__prefix = ()
+        self.__prefix_length = 0
+        self.__turns = []
+        self.__start = 0
+        self.__end = 0
+        self.__dropped = 0
+        self.__base = None
+        self.history = [self.initial_story]
+
+    @property
+    def history(self):
+        """list: The messages of the conversation, oldest first."""
+        if not self.__prefix:
+            return self.__turns[self.__start:self.__end]
+        messages = []
+        for turns, start, end in self.__prefix:
+            messages.extend(turns[start:end])
+        messages.extend(self.__turns[self.__start:self.__end])
+        return messages
+
+    @history.setter
+    def history(self, messages):
+        self.__prefix = ()
+        self.__prefix_length = 0
+        self.__turns = list(messages)
+        self.__start = 0
+        self.__end = len(self.__turns)
+        self.__dropped = 0
+
+    def __len__(self):
+        """Return the number of messages in the history."""
+        return self.__prefix_length + self.__end - self.__start
+
+    def __append(self, message):
+        if self.__end != len(self.__turns):
+            # Another branch already grew the shared list past our end, our
+            # turns become a shared segment and we go on with a list of our own.
+            if len(self.__prefix) >= _MAX_SEGMENTS:
+                self.history = self.history
+            else:
+                if self.__end > self.__start:
+                    self.__prefix += ((self.__turns, self.__start, self.__end),)
+                    self.__prefix_length += self.__end - self.__start
+                self.__turns = []
+                self.__start = self.__end = 0
+        self.__turns.append(message)
+        self.__end += 1
+
+    def __discard_oldest(self):
+        if self.__prefix:
+            turns, start, end = self.__prefix[0]
+            remaining = ((turns, start + 1, end),) if start + 1 < end else ()
+            self.__prefix = remaining + self.__prefix[1:]
+            self.__prefix_length -= 1
+        else:
+            self.__start += 1
+        self.__dropped += 1
+        # Dropped turns stay in the lists, compact once they outnumber the
+        # live ones so memory stays bounded.
+        if self.__dropped > len(self):
+            self.history = self.history
+
+    def __state(self):
+        return (self.__prefix, self.__turns, self.__start, self.__end)
 
     def add_human_message(self, message):
         """Add human interaction to the context manager.
@@ -37,15 +111,15 @@ class Conversation:
             message (str): User Input
         """
         # Vamos a hacer un experimento
-        if len(self.history) >= self.limit:
-            
+        if len(self) >= self.limit:
+
             if not self.discard_method:
-                self.history = self.history[1:]
+                self.__discard_oldest()
             else:
                 self.history = self.discard_method(self.history, self.discard_beams)
 
         # TODO: Find a formula to add weight to the interaction roles.
-        self.history.append(f"{self.locales['user_input']}: {message}")
+        self.__append(f"{self.locales['user_input']}: {message}")
 
     def add_ia_message(self, message):
         """Add Artificial Inteligence interaction to the context manager.
@@ -55,7 +129,7 @@ class Conversation:
         """
         # We discard values
         # TODO: Make a zero shot context importance rating model.
-        self.history.append(f"{self.locales['bot_output']}: {message}")
+        self.__append(f"{self.locales['bot_output']}: {message}")
 
     def make_prompt(self):
         """Yield the current context and interaction onto a prompt.
@@ -63,6 +137,8 @@ class Conversation:
         Returns:
             str: Current conversation context and chatbot responses.
         """
+        if not self.__prefix:
+            return "\n".join(self.__turns[self.__start:self.__end])
         return "\n".join(self.history)
 
     def reset_context(self):
@@ -71,3 +147,55 @@ class Conversation:
         """
         # TODO: Replace hardcoded string
         self.history = [self.initial_story]
+
+    def fork(self):
+        """Branch the conversation in O(1).
+
+        The branch shares every current turn with this conversation. New
+        turns on either side only cost their own messages, plus a small
+        segment reference for the side that diverges second. Past a few
+        nested divergences a branch flattens its history into one list of
+        references.
+
+        Returns:
+            Conversation: The branch, its parent is this conversation.
+        """
+        branch = self.__class__.__new__(self.__class__)
+        branch.__dict__.update(self.__dict__)
+        branch.parent = self
+        branch.__base = self.__state()
+        return branch
+
+    def commit(self):
+        """Make the parent conversation continue from this branch.
+
+        Raises:
+            ValueError: If the conversation is not a branch, or if the parent
+                changed since the fork (its new turns would be lost).
+        """
+        if self.parent is None:
+            raise ValueError("Only a forked conversation can be committed")
+        prefix, turns, start, end = self.parent.__state()
+        base_prefix, base_turns, base_start, base_end = self.__base
+        if prefix is not base_prefix or turns is not base_turns or (start, end) != (base_start, base_end):
+            raise ValueError("The parent conversation changed since the fork")
+        parent = self.parent
+        parent.__prefix = self.__prefix
+        parent.__prefix_length = self.__prefix_length
+        parent.__turns = self.__turns
+        parent.__start = self.__start
+        parent.__end = self.__end
+        parent.__dropped = self.__dropped
+        self.__base = parent.__state()
+
+    def discard(self):
+        """Drop the branch, its own turns are freed once unreferenced.
+
+        Raises:
+            ValueError: If the conversation is not a branch.
+        """
+        if self.parent is None:
+            raise ValueError("Only a forked conversation can be discarded")
+        self.parent = None
+        self.__base = None
+        self.history = []
@@ -17,7 +17,7 @@ Classes:
         module_name (str): Name of the module to be imported.
         __user_module_main_file (module): Imported module containing user-defined functions.
         __fn_list (list): List of function names extracted from the user-defined module.
-        __pipe (list): List of function names in order to be executed as a pipeline.
+        __pipe (list): List of functions in order to be executed as a pipeline.
         module_metadata (ModuleMetadata): Instance of the ModuleMetadata class.
 
     Methods:
@@ -26,11 +26,37 @@ Classes:
         __execute_function: Private method that executes a given function from the user-defined module.
         __metadata_extractor: Private method that extracts the metadata information from the user-defined module.
         execute_pipeline: Public method that executes the pipeline in order.
+        stream_pipeline: Public method that executes the pipeline lazily over chunks.
+
+Stages:
+    A stage is a whole value stage when it is a plain function, it receives the
+    complete output of the previous stage and returns a value.
+    A stage is a streaming stage when it is a generator function, it receives an
+    iterator of chunks and yields chunks:
+
+    ```python
+    @task_ordering(0)
+    def module_task_upper(chunks):
+        for chunk in chunks:
+            yield chunk.upper()
+    ```
+
+    Streaming stages are chained lazily, every stage pulls one chunk at a time
+    from the previous one, so only a chunk per stage is held in memory no matter
+    how long the output is. A whole value stage in the middle of a stream joins
+    the chunks it receives and emits its result as a single chunk.
 """
 
 from importlib import import_module
+from typing import Iterable, Iterator
 import gc
+import importlib
+import inspect
 import os
+import shutil
+import sys
+import threading
+import time
 
 class ModuleMetadata():
     """
@@ -73,32 +99,36 @@ class ModuleCompiler():
     
     Args:
         module_name (str): Name of the module to be imported.
+        package (str): Package that holds the user modules.
         
     Attributes:
         module_name (str): Name of the module to be imported.
         __user_module_main_file (module): Imported module containing user-defined functions.
         __fn_list (list): List of function names extracted from the user-defined module.
-        __pipe (list): List of function names in order to be executed as a pipeline.
+        __pipe (list): List of functions in order to be executed as a pipeline.
         
     Methods:
         __get_function_list: Private method that imports the user-defined module and extracts its functions.
         __make_pipeline: Private method that creates a pipeline based on the functions extracted from the module.
         __execute_function: Private method that executes a given function from the user-defined module.
         execute_pipeline: Public method that executes the pipeline in order.
+        stream_pipeline: Public method that executes the pipeline lazily over chunks.
     """
     
-    def __init__(self, module_name: str) -> None:
+    def __init__(self, module_name: str, package: str = "src.user_modules") -> None:
         """
         Initializes the ModuleCompiler instance.
         
         Args:
             module_name (str): Name of the module to be imported.
+            package (str): Package that holds the user modules. Default is "src.user_modules".
         """
         self.__feature_extraction_functions = []
         self.__task_functions = []
         self.__preprocess_functions = []
         
         self.module_name = module_name
+        self.package = package
         self.__get_function_list()
         self.__pipe = self.__make_pipeline()
         self.module_metadata = ModuleMetadata()
@@ -110,7 +140,7 @@ class ModuleCompiler():
     def __get_function_list(self):
         """Private method that imports the user-defined module and extracts its functions."""
         module_import = ".main"
-        package = ".".join(["src", "user_modules" , self.module_name])
+        package = ".".join([self.package, self.module_name])
         self.__user_module_main_file = import_module(module_import, 
                                                    package=package)
         module_contents = dir(self.__user_module_main_file)
@@ -136,6 +166,10 @@ class ModuleCompiler():
         self.__preprocess_functions.sort(key=lambda x: x[1])
         self.__feature_extraction_functions.sort(key=lambda x: x[1])
 
+        return [function for function, _ in (self.__feature_extraction_functions
+                                             + self.__preprocess_functions
+                                             + self.__task_functions)]
+
     def __execute_function(self, name: str, fn_input = None):
         """
         Private method that executes a given function from the user-defined module.
@@ -148,7 +182,7 @@ class ModuleCompiler():
             Output of the function.
         """
         func = getattr(self.__user_module_main_file, name)
-        if input:
+        if fn_input is not None:
             return func(fn_input)
         return func()
     
@@ -183,15 +217,82 @@ class ModuleCompiler():
                 case "META_LICENCE":
                     self.module_metadata.module_licence = getattr(target, meta_tag)
                 
-#    def execute_pipeline(self, fn_input = None):
-#        """
-#        Public method that executes the pipeline in order.
-#        
-#        Args:
-#            fn_input (optional): Input for the pipeline. Defaults to None.
-#        """
-#        for fn in self.__pipe:
-#            fn_input = self.__execute_function(fn, fn_input)
+    def execute_pipeline(self, fn_input = None):
+        """
+        Public method that executes the pipeline in order.
+        
+        Args:
+            fn_input (optional): Input for the pipeline. Defaults to None.
+
+        Returns:
+            Output of the last stage, streaming stages are fed the input as a single chunk.
+        """
+        for fn in self.__pipe:
+            if inspect.isgeneratorfunction(fn):
+                fn_input = _join_chunks(fn(iter([fn_input])))
+            else:
+                fn_input = fn(fn_input)
+        return fn_input
+
+    def stream_pipeline(self, chunks: Iterable) -> Iterator:
+        """
+        Public method that executes the pipeline lazily over an iterable of chunks.
+
+        Nothing runs until the returned iterator is consumed, then every chunk
+        flows through all the stages as soon as the source produces it.
+
+        Args:
+            chunks (Iterable): Chunks of the input, e.g. the pieces of a streamed reply.
+
+        Returns:
+            Iterator: Chunks of the output of the last stage.
+        """
+        stream = iter(chunks)
+        for fn in self.__pipe:
+            if inspect.isgeneratorfunction(fn):
+                stream = fn(stream)
+            else:
+                stream = _whole_value_stage(fn, stream)
+        return stream
+
+
+def _join_chunks(chunks: Iterable):
+    """Join a stream of chunks back into a whole value.
+
+    A single chunk is returned as is, strings and bytes are concatenated
+    (an empty stream joins to ""), any other mix is returned as a list.
+    """
+    values = list(chunks)
+    if len(values) == 1:
+        return values[0]
+    if all(isinstance(value, str) for value in values):
+        return "".join(values)
+    if all(isinstance(value, bytes) for value in values):
+        return b"".join(values)
+    return values
+
+
+def _whole_value_stage(fn, chunks: Iterator) -> Iterator:
+    """Run a whole value stage inside a stream, it waits for all the chunks."""
+    yield fn(_join_chunks(chunks))
+
+class _ModuleSnapshot:
+    """Immutable view of the loaded modules, swapped as a whole on reload."""
+
+    __slots__ = ("modules", "fingerprints", "descriptions")
+
+    def __init__(self, modules: dict, fingerprints: dict):
+        self.modules = modules
+        self.fingerprints = fingerprints
+        # Routing index, built once per version instead of once per request
+        descriptions_list = ""
+        i = 0
+        for compiled_module in modules.values():
+            i += 1
+            descriptions_list += f"\t{i}. {compiled_module.description_prompt}\n"
+        descriptions_list += f"\t{i+1}. Chatbot\n"
+        self.descriptions = (descriptions_list[:-1], len(modules))
+
 
 class ModuleManager:
     """
@@ -199,53 +300,188 @@ class ModuleManager:
 
     Args:
     - module_locations (str): path to the directory where the user modules are located. Default is "./src/user_modules".
+    - package (str): importable package name of that directory. Default is "src.user_modules".
 
     Attributes:
     - module_locations (str): path to the directory where the user modules are located.
-    - __modules (list): list of compiled user modules.
-    - __descriptions (list): list of descriptions of the user modules.
+    - __snapshot (_ModuleSnapshot): compiled user modules, their file fingerprints and the descriptions prompt.
+    - reload_count (int): number of reloads that changed at least one module.
+    - last_reload_seconds (float): duration of the last reload that changed something.
+    - reload_errors (dict): last compile error of every module that failed to reload.
+    - watch_error (OSError): error of the last scan of the watcher thread, None once a scan succeeds.
 
     Methods:
-    - __locate_modules(): private method that compiles the user modules and stores them in __modules.
-    - return_descriptions(): method that returns a string with the descriptions of the user modules in __descriptions.
-
+    - __locate_modules(): private method that compiles the user modules and stores them in __snapshot.
+    - return_descriptions(): method that returns a string with the descriptions of the user modules.
+    - reload_changed(): method that recompiles the modules whose files changed.
+    - start_watching() / stop_watching(): methods that run reload_changed in a background thread.
+
+    Hot reload:
+        Readers never lock, they use the snapshot that is current when they
+        start. A reload compiles the changed modules aside and replaces the
+        snapshot in one assignment, so requests in flight finish with the
+        module objects they already hold.
     """
 
-    def __init__(self, module_locations="./src/user_modules"):
+    def __init__(self, module_locations="./src/user_modules", package="src.user_modules"):
         """
         Constructor for the ModuleManager class.
 
         Args:
         - module_locations (str): path to the directory where the user modules are located. Default is "./src/user_modules".
+        - package (str): importable package name of that directory. Default is "src.user_modules".
         """
         self.module_locations = module_locations
-        self.__modules = []
-        self.__descriptions = []
+        self.package = package
+        self.reload_count = 0
+        self.last_reload_seconds = 0.0
+        self.reload_errors = {}
+        self.watch_error = None
+        self.__reload_lock = threading.Lock()
+        self.__watcher = None
+        self.__stop_watching = threading.Event()
 
         self.__locate_modules()
 
 
     def __locate_modules(self):
         """
-        Private method that compiles the user modules and stores them in __modules.
+        Private method that compiles the user modules and stores them in __snapshot.
+        """
+        modules = {}
+        fingerprints = {}
+        for d in self.__module_names():
+            fingerprints[d] = self.__fingerprint(d)
+            modules[d] = ModuleCompiler(d, self.package)
+        self.__snapshot = _ModuleSnapshot(modules, fingerprints)
+
+    def __module_names(self):
+        """Private method that lists the module directories, sorted so the routing indices are stable."""
+        return sorted(d for d in os.listdir(self.module_locations)
+                      if not d.startswith((".", "__"))
+                      and os.path.isdir(os.path.join(self.module_locations, d)))
+
+    def __fingerprint(self, name: str):
+        """Private method that summarizes the source files of a module."""
+        fingerprint = []
+        root = os.path.join(self.module_locations, name)
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories[:] = [d for d in subdirectories if d != "__pycache__"]
+            for file_name in files:
+                if file_name.endswith(".py"):
+                    stat = os.stat(os.path.join(directory, file_name))
+                    fingerprint.append((os.path.relpath(os.path.join(directory, file_name), root),
+                                        stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(fingerprint))
+
+    def __forget_imports(self, name: str):
+        """Private method that drops a module and its submodules from the import cache."""
+        prefix = f"{self.package}.{name}"
+        for imported in [m for m in sys.modules if m == prefix or m.startswith(prefix + ".")]:
+            del sys.modules[imported]
+
+    def __drop_bytecode(self, name: str):
+        """Private method that deletes the cached bytecode of a module.
+
+        The .pyc check only compares the whole second mtime and the size of
+        the source, so an edit that keeps the size within the same second
+        would import the old bytecode.
+        """
+        root = os.path.join(self.module_locations, name)
+        for directory, subdirectories, _ in os.walk(root):
+            if "__pycache__" in subdirectories:
+                subdirectories.remove("__pycache__")
+                shutil.rmtree(os.path.join(directory, "__pycache__"), ignore_errors=True)
+
+    @property
+    def modules(self):
+        """dict: Compiled modules by directory name, a stable view for one request."""
+        return self.__snapshot.modules
+
+    def reload_changed(self):
         """
-        for d in os.listdir(self.module_locations):
-            compiled_module = ModuleCompiler(d)
-            self.__modules.append(compiled_module)
-            self.__descriptions.append(compiled_module.description_prompt)
+        Method that recompiles the new or changed modules and drops the deleted ones.
+
+        A module that fails to compile keeps its previous version, the error is kept in reload_errors.
+
+        Returns:
+        - changed (list): names of the modules added, recompiled or removed.
+        """
+        with self.__reload_lock:
+            start = time.perf_counter()
+            current = self.__snapshot
+            modules = dict(current.modules)
+            fingerprints = dict(current.fingerprints)
+            changed = []
+
+            names = self.__module_names()
+            for name in set(modules).difference(names):
+                del modules[name]
+                del fingerprints[name]
+                self.reload_errors.pop(name, None)
+                changed.append(name)
+
+            for name in names:
+                fingerprint = self.__fingerprint(name)
+                if fingerprints.get(name) == fingerprint:
+                    continue
+                fingerprints[name] = fingerprint
+                self.__forget_imports(name)
+                self.__drop_bytecode(name)
+                importlib.invalidate_caches()
+                try:
+                    modules[name] = ModuleCompiler(name, self.package)
+                except Exception as error:
+                    self.reload_errors[name] = error
+                    continue
+                self.reload_errors.pop(name, None)
+                changed.append(name)
+
+            if changed:
+                # Keep the directory order of __locate_modules
+                ordered = {name: modules[name] for name in names if name in modules}
+                self.__snapshot = _ModuleSnapshot(ordered, fingerprints)
+                self.reload_count += 1
+                self.last_reload_seconds = time.perf_counter() - start
+            return changed
+
+    def start_watching(self, interval: float = 1.0):
+        """
+        Method that starts a daemon thread calling reload_changed every interval seconds.
+
+        Args:
+        - interval (float): seconds between two scans of the modules directory. Default is 1.
+        """
+        if self.__watcher is not None:
+            return
+        self.__stop_watching.clear()
+
+        def watch():
+            while not self.__stop_watching.wait(interval):
+                try:
+                    self.reload_changed()
+                    self.watch_error = None
+                except OSError as error:
+                    # e.g. the directory is being replaced, the next scan retries
+                    self.watch_error = error
+
+        self.__watcher = threading.Thread(target=watch, name="module-watcher", daemon=True)
+        self.__watcher.start()
+
+    def stop_watching(self):
+        """Method that stops the watcher thread."""
+        if self.__watcher is None:
+            return
+        self.__stop_watching.set()
+        self.__watcher.join()
+        self.__watcher = None
 
-        
     def return_descriptions(self):
         """
-        Method that returns a string with the descriptions of the user modules in __descriptions.
+        Method that returns a string with the descriptions of the user modules.
 
         Returns:
-        - descriptions_list (str): string with the descriptions of the user modules in __descriptions.
+        - descriptions_list (str): string with the descriptions of the user modules.
+        - count (int): number of user modules.
         """
-        descriptions_list = ""
-        i = 0
-        for descr in self.__descriptions:
-            i += 1
-            descriptions_list += f"\t{i}. {descr}\n"
-        descriptions_list += f"\t{i+1}. Chatbot\n"
-        return descriptions_list[:-1], len(self.__descriptions)
+        return self.__snapshot.descriptions
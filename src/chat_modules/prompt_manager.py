@@ -7,23 +7,28 @@ from src.i18n.i18n import I18nManager
 from time import sleep
 
 class PromptManager:
-    def __init__(self, chatbot, locales):
+    def __init__(self, chatbot, locales, module_manager: ModuleManager = None):
         self.chatbot: BaseChatBotManager = chatbot
-        self.module_manager = ModuleManager()
+        self.module_manager = module_manager if module_manager is not None else ModuleManager()
         self.strings = locales
 
+    def routing_prompt(self, command):
+        """Build the prompt that asks the chatbot which module fits the input."""
+        prompt_head = ("Imagina que eres un programador profesional de chatbots\n"
+                       f"Según el input: ({command}), ¿cual de los siguientes se ajustaria"
+                        " de mejor manera para resolver el problema?\n")
+
+        task, module_lenght = self.module_manager.return_descriptions()
+        prompt_head += task
+        prompt_head += "\nEs muy importante que solo escojas una respuesta, ya que solo una respuesta es correcta."
+        return prompt_head
+
     def chatbot_cli_mainloop(self):
         command = ""
         print(self.strings['welcome_message'])
         while command != "$exit":
             command = input(self.strings['chatbot_input'])
-            prompt_head = ("Imagina que eres un programador profesional de chatbots\n"
-                           f"Según el input: ({command}), ¿cual de los siguientes se ajustaria"
-                            " de mejor manera para resolver el problema?\n")
-
-            task, module_lenght = self.module_manager.return_descriptions()
-            prompt_head += task
-            prompt_head += "\nEs muy importante que solo escojas una respuesta, ya que solo una respuesta es correcta."
+            prompt_head = self.routing_prompt(command)
             response = self.chatbot.chatbot_query(prompt_head)
 
             print("============ PROMPT HEAD =====================")
@@ -0,0 +1,135 @@
+"""Local reranking of candidate chatbot replies.
+
+This module provides the rerankers used by BaseChatBotManager.generate when
+it asks for several candidates of the same turn, and the metrics of how
+often reranking changes the reply.
+
+Usage:
+```python
+reply = chatbot.generate("Hello", n_best=4, reranker=HeuristicReranker(locales))
+chatbot.n_best_metrics.winner_changed_ratio
+```
+"""
+import re
+import threading
+
+_WORDS = re.compile(r"\w+")
+
+
+class BaseReranker:
+    """A base class for scoring candidate replies, the highest score wins."""
+
+    def score(self, candidate: str, prompt: str) -> float:
+        """Score one candidate.
+
+        Args:
+            candidate (str): The preprocessed reply.
+            prompt (str): The prompt that produced it.
+
+        Returns:
+            float: The score, higher is better.
+
+        Raises:
+            NotImplementedError: If the method is not implemented by a subclass.
+        """
+        raise NotImplementedError("This is a base class")
+
+    def select(self, candidates: list, prompt: str) -> int:
+        """Return the index of the best candidate, the first one wins ties."""
+        scores = [self.score(candidate, prompt) for candidate in candidates]
+        return scores.index(max(scores))
+
+
+class HeuristicReranker(BaseReranker):
+    """Score replies by length, overlap with the context and clean prefixes.
+
+    Args:
+        locales (I18nManager): Translations, used to recognize role prefixes.
+        target_words (int, optional): Replies shorter than this are penalized.
+            Defaults to 30.
+        context_turns (int, optional): Prompt lines used for the overlap.
+            Defaults to 4.
+        length_weight (float, optional): Weight of the length score. Defaults to 1.
+        overlap_weight (float, optional): Weight of the overlap score. Defaults to 1.
+        prefix_weight (float, optional): Weight of the prefix score. Defaults to 2.
+    """
+
+    def __init__(self, locales, target_words: int = 30, context_turns: int = 4,
+                 length_weight: float = 1.0, overlap_weight: float = 1.0, prefix_weight: float = 2.0):
+        """Init the reranker."""
+        self.target_words = target_words
+        self.context_turns = context_turns
+        self.length_weight = length_weight
+        self.overlap_weight = overlap_weight
+        self.prefix_weight = prefix_weight
+        self.role_prefixes = tuple({locales['user_input'].strip(), locales['bot_output'].strip(),
+                                    "Human:", "Bot:"})
+
+    def score(self, candidate: str, prompt: str) -> float:
+        """Score one candidate, see the class docstring."""
+        words = _WORDS.findall(candidate.lower())
+        if not words:
+            return float("-inf")
+
+        length = min(len(words) / self.target_words, 1.0)
+
+        context = set(_WORDS.findall(" ".join(prompt.splitlines()[-self.context_turns:]).lower()))
+        overlap = len(context.intersection(words)) / len(set(words))
+
+        # Leftover role prefixes mean the model kept writing the dialogue
+        clean = 1.0
+        if candidate.lstrip().startswith(self.role_prefixes):
+            clean -= 0.5
+        if any(f"\n{prefix}" in candidate for prefix in self.role_prefixes):
+            clean -= 0.5
+
+        return (self.length_weight * length + self.overlap_weight * overlap
+                + self.prefix_weight * clean)
+
+
+class NBestMetrics:
+    """Counters of the n-best turns of a chatbot manager.
+
+    Attributes:
+        turns (int): Turns generated with more than one candidate.
+        candidates (int): Candidates received.
+        failed_candidates (int): Candidate queries that raised.
+        winner_changed (int): Turns where the winner was not the first query.
+    """
+
+    def __init__(self):
+        """Init the counters."""
+        self.turns = 0
+        self.candidates = 0
+        self.failed_candidates = 0
+        self.winner_changed = 0
+        self.__lock = threading.Lock()
+
+    def record(self, candidates: int, failed: int, winner: int = None):
+        """Count one turn, generate runs in many threads at once.
+
+        Args:
+            candidates (int): Candidates received.
+            failed (int): Candidate queries that raised.
+            winner (int, optional): Query index of the winner, None if every query failed.
+        """
+        with self.__lock:
+            self.failed_candidates += failed
+            if winner is None:
+                return
+            self.turns += 1
+            self.candidates += candidates
+            if winner != 0:
+                self.winner_changed += 1
+
+    @property
+    def winner_changed_ratio(self):
+        """float: Fraction of the turns where reranking changed the reply."""
+        return self.winner_changed / self.turns if self.turns else 0.0
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {"turns": self.turns, "candidates": self.candidates,
+                "failed_candidates": self.failed_candidates,
+                "winner_changed": self.winner_changed,
+                "winner_changed_ratio": self.winner_changed_ratio}
@@ -0,0 +1,378 @@
+"""Asyncio network front-end for the chatbot.
+
+This module provides the ChatServer class, a line protocol server that
+multiplexes many client sessions over one chatbot manager, one ModuleManager
+and the shared I18nManager instances.
+
+Every line sent by a client is a JSON object and every answer is a JSON line:
+
+    {"type": "hello", "session_id": "abc", "locale": "en"}
+    {"type": "message", "message": "Hello"}
+    {"type": "route", "message": "Write a script"}
+    {"type": "reset"}
+    {"type": "bye"}
+
+Usage:
+```python
+server = ChatServer(EchoChatBot(LOCALES), LOCALES)
+asyncio.run(server.serve_forever())
+```
+"""
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import signal
+import time
+import uuid
+
+from src.chat_modules.chatbot_api import BaseChatBotManager
+from src.chat_modules.module_models import ModuleManager
+from src.chat_modules.prompt_manager import PromptManager
+from src.chat_modules.session_store import SharedSessionStore
+from src.i18n.i18n import I18nManager
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """State of one client session.
+
+    Attributes:
+        session_id (str): Identifier of the session, clients can resume it.
+        locales (I18nManager): Translations used by the session.
+        conversation (Conversation): Context of the session.
+        lock (asyncio.Lock): Serializes the turns of the session.
+        last_used (float): time.monotonic() of the last request.
+    """
+
+    def __init__(self, session_id: str, locales: I18nManager, conversation):
+        """Init the session.
+
+        Args:
+            session_id (str): Identifier of the session.
+            locales (I18nManager): Translations used by the session.
+            conversation (Conversation): Context of the session.
+        """
+        self.session_id = session_id
+        self.locales = locales
+        self.conversation = conversation
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class ChatServer:
+    """Serve the chatbot to many concurrent clients over TCP.
+
+    The chatbot manager is blocking, so every backend call runs in a worker
+    thread. A semaphore bounds the backend calls in flight, each connection
+    handles one request at a time and waits for the socket to drain before
+    reading the next line, so slow clients and a slow backend push back on
+    the readers instead of queueing unbounded work.
+
+    Args:
+        chatbot (BaseChatBotManager): Shared chatbot manager.
+        locales (I18nManager): Default translations.
+        module_manager (ModuleManager, optional): Shared module manager.
+            Defaults to a new ModuleManager.
+        host (str, optional): Address to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind, 0 picks a free one. Defaults to 8765.
+        max_connections (int, optional): Connections served at once, the
+            rest wait to be accepted. Defaults to 100.
+        max_inflight (int, optional): Backend calls in flight. Defaults to 8.
+        max_line_size (int, optional): Bytes accepted per request line.
+            Defaults to 65536.
+        i18n_database_path (str, optional): Translations database used to
+            load the per connection locales.
+        session_store (SharedSessionStore, optional): Store shared with the
+            other worker processes, when given every turn reads and writes the
+            history there so any worker can serve any session.
+        max_sessions (int, optional): Sessions kept in memory, the least
+            recently used ones are dropped first. Defaults to 10000.
+        session_ttl (float, optional): Seconds a session is kept without
+            requests. Defaults to 3600.
+
+    Sessions opened without a session_id are dropped with their connection.
+    """
+
+    def __init__(self, chatbot: BaseChatBotManager, locales: I18nManager,
+                 module_manager: ModuleManager = None, host: str = "127.0.0.1",
+                 port: int = 8765, max_connections: int = 100, max_inflight: int = 8,
+                 max_line_size: int = 65536,
+                 i18n_database_path: str = "./src/i18n/strings.json",
+                 session_store: SharedSessionStore = None, max_sessions: int = 10000,
+                 session_ttl: float = 3600.0):
+        """Init the server, nothing is bound until start is awaited."""
+        self.chatbot = chatbot
+        self.session_store = session_store
+        self.locales = locales
+        self.prompt_manager = PromptManager(chatbot, locales, module_manager)
+        self.module_manager = self.prompt_manager.module_manager
+        self.host = host
+        self.port = port
+        self.max_line_size = max_line_size
+        self.i18n_database_path = i18n_database_path
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+
+        self.__max_connections = max_connections
+        self.__max_inflight = max_inflight
+        self.__locales_cache = {}
+        self.__sessions = OrderedDict()
+        self.__connections = set()
+        self.__server = None
+        self.__closing = None
+
+    async def start(self):
+        """Bind the socket and start accepting clients.
+
+        Returns:
+            tuple: The host and port the server is listening on.
+        """
+        self.__connection_slots = asyncio.Semaphore(self.__max_connections)
+        self.__backend_slots = asyncio.Semaphore(self.__max_inflight)
+        self.__closing = asyncio.Event()
+        self.__server = await asyncio.start_server(self.__handle_client, self.host,
+                                                   self.port, limit=self.max_line_size)
+        self.host, self.port = self.__server.sockets[0].getsockname()[:2]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        """Serve until SIGINT or SIGTERM, then shut down gracefully."""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.__closing.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        await self.__closing.wait()
+        await self.shutdown()
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Stop accepting clients and let the current requests finish.
+
+        Connections are closed after their current request is answered,
+        the ones still busy after the timeout are cancelled.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the requests in
+                flight. Defaults to 10.
+        """
+        if self.__server is None:
+            return
+        self.__closing.set()
+        self.__server.close()
+        # Since Python 3.12.1 wait_closed also waits for the connections, cancel the stuck ones first
+        if self.__connections:
+            _, pending = await asyncio.wait(self.__connections, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self.__server.wait_closed()
+        self.__server = None
+
+    def get_locales(self, language: str = None):
+        """Return the shared translations for a language.
+
+        Args:
+            language (str, optional): The language code. Defaults to the
+                server locales.
+
+        Returns:
+            I18nManager: The translations database of that language.
+
+        Raises:
+            ValueError: If the language is not in the translations database.
+        """
+        if not language:
+            return self.locales
+        if not isinstance(language, str):
+            raise ValueError("locale must be a string")
+        if language not in self.__locales_cache:
+            try:
+                self.__locales_cache[language] = I18nManager(self.i18n_database_path, language)
+            except KeyError:
+                raise ValueError(f"unknown locale: {language}") from None
+        return self.__locales_cache[language]
+
+    def get_session(self, session_id: str = None, language: str = None):
+        """Return the session with that id, creating it if it does not exist.
+
+        Args:
+            session_id (str, optional): Identifier of the session. Defaults
+                to a new random id.
+            language (str, optional): Language of a new session.
+
+        Returns:
+            ChatSession: The session.
+
+        Raises:
+            ValueError: If the session id or the language are not valid.
+        """
+        if session_id is not None and (not isinstance(session_id, str) or not 0 < len(session_id) <= 64):
+            raise ValueError("session_id must be a string of 1 to 64 characters")
+        if (session_id is not None and self.session_store is not None
+                and len(session_id.encode("utf-8")) > self.session_store.max_key_bytes):
+            raise ValueError(f"session_id must fit in {self.session_store.max_key_bytes} UTF-8 bytes")
+        session_id = session_id or uuid.uuid4().hex
+        self.__expire_sessions()
+        session = self.__sessions.get(session_id)
+        if session is None:
+            locales = self.get_locales(language)
+            session = ChatSession(session_id, locales, self.chatbot.new_conversation(locales))
+            self.__sessions[session_id] = session
+            while len(self.__sessions) > self.max_sessions:
+                self.__sessions.popitem(last=False)
+        self.__touch(session)
+        return session
+
+    def drop_session(self, session_id: str):
+        """Forget a session and its conversation."""
+        self.__sessions.pop(session_id, None)
+
+    def session_count(self):
+        """Return the number of sessions kept in memory."""
+        return len(self.__sessions)
+
+    def __touch(self, session: ChatSession):
+        """Mark a session as just used, the map stays ordered from the least recently used."""
+        session.last_used = time.monotonic()
+        if session.session_id in self.__sessions:
+            self.__sessions.move_to_end(session.session_id)
+
+    def __expire_sessions(self):
+        """Drop the sessions idle for longer than session_ttl, oldest first."""
+        deadline = time.monotonic() - self.session_ttl
+        while self.__sessions:
+            session = next(iter(self.__sessions.values()))
+            if session.last_used >= deadline:
+                break
+            self.__sessions.popitem(last=False)
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one connection until the client leaves or the server closes."""
+        task = asyncio.current_task()
+        self.__connections.add(task)
+        try:
+            async with self.__connection_slots:
+                await self.__serve_connection(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.__connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def __serve_connection(self, reader, writer):
+        """Read the request lines of a connection and answer each of them."""
+        anonymous = set()
+        try:
+            await self.__read_requests(reader, writer, anonymous)
+        finally:
+            for session_id in anonymous:
+                self.drop_session(session_id)
+
+    async def __read_requests(self, reader, writer, anonymous: set):
+        """Answer the request lines of a connection, collecting its anonymous sessions."""
+        session = None
+        while not self.__closing.is_set():
+            line_task = asyncio.ensure_future(reader.readline())
+            closing_task = asyncio.ensure_future(self.__closing.wait())
+            await asyncio.wait((line_task, closing_task), return_when=asyncio.FIRST_COMPLETED)
+            closing_task.cancel()
+            if not line_task.done():
+                line_task.cancel()
+                break
+            try:
+                line = line_task.result()
+            except ValueError:
+                await self.__send(writer, {"error": "line too long"})
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be an object")
+            except ValueError as error:
+                await self.__send(writer, {"error": f"bad request: {error}"})
+                continue
+
+            kind = request.get("type", "message")
+            if kind == "bye":
+                break
+            if kind == "hello" or session is None:
+                try:
+                    session = self.get_session(request.get("session_id"), request.get("locale"))
+                except ValueError as error:
+                    await self.__send(writer, {"error": f"bad request: {error}"})
+                    continue
+                if request.get("session_id") is None:
+                    anonymous.add(session.session_id)
+                if kind == "hello":
+                    await self.__send(writer, {"session_id": session.session_id,
+                                               "welcome": session.locales['welcome_message']})
+                    continue
+            await self.__send(writer, await self.__dispatch(session, kind, request))
+
+    async def __dispatch(self, session: ChatSession, kind: str, request: dict):
+        """Run one request of a session and build its answer."""
+        answer = {"session_id": session.session_id}
+        self.__touch(session)
+        if kind == "reset":
+            async with session.lock:
+                session.conversation.reset_context()
+                if self.session_store is not None:
+                    await asyncio.to_thread(self.session_store.delete, session.session_id)
+            answer["reset"] = True
+            return answer
+        if kind not in ("message", "route"):
+            answer["error"] = f"unknown request type: {kind}"
+            return answer
+
+        message = request.get("message")
+        if not isinstance(message, str):
+            answer["error"] = "message must be a string"
+            return answer
+
+        async with session.lock, self.__backend_slots:
+            try:
+                if kind == "route":
+                    prompt = self.prompt_manager.routing_prompt(message)
+                    reply = await asyncio.to_thread(self.chatbot.chatbot_query, prompt)
+                    answer["reply"] = self.chatbot.preprocess(reply)
+                else:
+                    answer["reply"] = await asyncio.to_thread(self.__run_turn, session, message)
+            except Exception:
+                # The exception text may hold internal details, it only goes to the log
+                logger.exception("Request of session %s failed", session.session_id)
+                answer["error"] = session.locales['api_error_message']
+        return answer
+
+    def __run_turn(self, session: ChatSession, message: str):
+        """Generate a reply, through the shared store when there is one."""
+        if self.session_store is None:
+            return self.chatbot.generate(message, session.conversation)
+        with self.session_store.lock(session.session_id):
+            history = self.session_store.load(session.session_id)
+            # No record means a new, reset or evicted session, whatever this worker remembers
+            if history:
+                session.conversation.history = history
+            else:
+                session.conversation.reset_context()
+            reply = self.chatbot.generate(message, session.conversation)
+            self.session_store.save(session.session_id, session.conversation.history)
+        return reply
+
+    @staticmethod
+    async def __send(writer: asyncio.StreamWriter, payload: dict):
+        """Write one answer line and wait for the client to read it."""
+        writer.write(json.dumps(payload, ensure_ascii=False).encode() + b"\n")
+        await writer.drain()
@@ -0,0 +1,320 @@
+"""Conversation records shared by every worker process.
+
+This module provides the SharedSessionStore class, a fixed size table of
+conversation histories kept in a memory mapped file. Workers on the same
+host map the same file, so any of them can serve any session without an
+external service. Place the file in /dev/shm to keep it in memory.
+
+Layout, little endian:
+    header: magic (8s), version (I), slots (I), slot_size (I), padding up to 64 bytes
+    slot:   key length (H), key (62s), turns (I), payload bytes (I),
+            last used (d, time.time()), payload
+    payload: for every message, its length (I) and its UTF-8 bytes
+
+Every slot is locked with a POSIX record lock on its own byte range, so
+workers only wait for each other when they touch the same session. When
+every slot is taken, a new session takes the least recently used one that
+no worker holds.
+
+Usage:
+```python
+store = SharedSessionStore("/dev/shm/chatbot.sessions")
+with store.lock(session_id):
+    conversation.history = store.load(session_id) or conversation.history
+    chatbot.generate(message, conversation)
+    store.save(session_id, conversation.history)
+```
+"""
+from contextlib import contextmanager
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+_HEADER = struct.Struct("<8sIII")
+_HEADER_SIZE = 64
+_SLOT = struct.Struct("<H62sIId")
+_KEY_SIZE = 62
+_LENGTH = struct.Struct("<I")
+_MAGIC = b"SCCBSESS"
+_VERSION = 2
+_EMPTY = 0
+_DELETED = 0xFFFF
+
+
+class SharedSessionStore:
+    """Keep conversation histories in a memory mapped file shared by processes.
+
+    Args:
+        path (str): File of the store, created if it does not exist.
+        slots (int, optional): Sessions the store can hold. Defaults to 1024.
+        slot_size (int, optional): Bytes per session, the oldest messages
+            after the first one are dropped to fit. Defaults to 16384.
+
+    Attributes:
+        max_key_bytes (int): Longest session id accepted, in UTF-8 bytes.
+        evictions (int): Sessions this instance evicted to make room.
+
+    Raises:
+        ValueError: If the file exists with another layout.
+    """
+
+    max_key_bytes = _KEY_SIZE
+
+    def __init__(self, path: str, slots: int = 1024, slot_size: int = 16384):
+        """Open or create the store."""
+        self.path = path
+        self.__fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Record locks belong to the process, threads need their own locks
+        self.__header_thread_lock = threading.Lock()
+        self.__thread_locks = [threading.RLock() for _ in range(64)]
+        self.__depth = {}
+        self.evictions = 0
+        with self.__header_lock():
+            if os.fstat(self.__fd).st_size == 0:
+                os.ftruncate(self.__fd, _HEADER_SIZE + slots * slot_size)
+                os.pwrite(self.__fd, _HEADER.pack(_MAGIC, _VERSION, slots, slot_size), 0)
+            magic, version, slots, slot_size = _HEADER.unpack(os.pread(self.__fd, _HEADER.size, 0))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a session store")
+
+        self.slots = slots
+        self.slot_size = slot_size
+        self.__map = mmap.mmap(self.__fd, _HEADER_SIZE + slots * slot_size)
+        self.__view = memoryview(self.__map)
+
+    def close(self):
+        """Unmap the file, the data stays for the other processes."""
+        self.__view.release()
+        self.__map.close()
+        os.close(self.__fd)
+
+    @contextmanager
+    def lock(self, session_id: str):
+        """Hold the session for a whole turn.
+
+        load, save and delete lock the session themselves, use this to make
+        a read, generate and write sequence atomic across workers.
+
+        Args:
+            session_id (str): Identifier of the session.
+        """
+        with self.__locked_slot(session_id, create=True):
+            yield
+
+    def load(self, session_id: str):
+        """Return the messages of a session.
+
+        Args:
+            session_id (str): Identifier of the session.
+
+        Returns:
+            list: The messages, None if the session is not stored.
+        """
+        with self.read(session_id) as chunks:
+            if chunks is None:
+                return None
+            return [str(chunk, "utf-8") for chunk in chunks]
+
+    @contextmanager
+    def read(self, session_id: str):
+        """Read the messages of a session without copying them.
+
+        Args:
+            session_id (str): Identifier of the session.
+
+        Yields:
+            list: memoryviews over the UTF-8 messages, valid inside the
+                block only, or None if the session is not stored.
+        """
+        with self.__locked_slot(session_id) as index:
+            if index is None:
+                yield None
+                return
+            chunks = []
+            offset = self.__offset(index)
+            _, _, turns, _, _ = _SLOT.unpack_from(self.__map, offset)
+            position = offset + _SLOT.size
+            for _ in range(turns):
+                (length,) = _LENGTH.unpack_from(self.__map, position)
+                position += _LENGTH.size
+                chunks.append(self.__view[position:position + length])
+                position += length
+            try:
+                yield chunks
+            finally:
+                for chunk in chunks:
+                    chunk.release()
+
+    def save(self, session_id: str, messages: list):
+        """Store the messages of a session.
+
+        Args:
+            session_id (str): Identifier of the session.
+            messages (list): The messages, oldest first.
+
+        Raises:
+            ValueError: If the first message alone does not fit in a slot.
+            RuntimeError: If every slot is held by a worker.
+        """
+        encoded = [message.encode("utf-8") for message in messages]
+        capacity = self.slot_size - _SLOT.size
+        used = sum(_LENGTH.size + len(message) for message in encoded)
+        # Like Conversation, keep the initial prompt and drop the oldest turns
+        while used > capacity and len(encoded) > 1:
+            used -= _LENGTH.size + len(encoded.pop(1))
+        if used > capacity:
+            raise ValueError(f"The session {session_id} does not fit in {self.slot_size} bytes")
+
+        with self.__locked_slot(session_id, create=True) as index:
+            offset = self.__offset(index)
+            key_length, key, _, _, _ = _SLOT.unpack_from(self.__map, offset)
+            position = offset + _SLOT.size
+            for message in encoded:
+                _LENGTH.pack_into(self.__map, position, len(message))
+                position += _LENGTH.size
+                self.__map[position:position + len(message)] = message
+                position += len(message)
+            _SLOT.pack_into(self.__map, offset, key_length, key, len(encoded), used, time.time())
+
+    def delete(self, session_id: str):
+        """Forget a session.
+
+        Args:
+            session_id (str): Identifier of the session.
+        """
+        with self.__locked_slot(session_id) as index:
+            if index is not None:
+                _SLOT.pack_into(self.__map, self.__offset(index), _DELETED, b"", 0, 0, 0.0)
+
+    def __offset(self, index: int):
+        return _HEADER_SIZE + index * self.slot_size
+
+    @contextmanager
+    def __locked_slot(self, session_id: str, create: bool = False):
+        """Find the slot of a session and hold it, None if it is not stored.
+
+        The probe runs without locks, so the slot may have been evicted or
+        deleted before we got it, in that case the key is looked up again.
+        """
+        key = session_id.encode("utf-8")
+        while True:
+            index = self.__find(key, create)
+            if index is None:
+                yield None
+                return
+            with self.__slot_lock(index):
+                key_length, stored, _, _, _ = _SLOT.unpack_from(self.__map, self.__offset(index))
+                if key_length not in (_EMPTY, _DELETED) and stored[:key_length] == key:
+                    yield index
+                    return
+
+    def __find(self, key: bytes, create: bool = False):
+        """Return the slot of a key, open addressing with linear probing."""
+        if len(key) > _KEY_SIZE:
+            raise ValueError(f"Session ids are limited to {_KEY_SIZE} bytes")
+        index = self.__probe(key)
+        if isinstance(index, int) or not create:
+            return index if isinstance(index, int) else None
+
+        # Claim a slot with the header locked so two workers can't take the same one
+        with self.__header_lock():
+            index = self.__probe(key)
+            if isinstance(index, int):
+                return index
+            if index is None:
+                return self.__evict(key)
+            # A free slot has no owner to wait for, whoever holds it only checks its key
+            self.__claim(index[0], key)
+            return index[0]
+
+    def __probe(self, key: bytes):
+        """Return the slot index of the key, else a tuple with the first free slot, else None."""
+        start = zlib.crc32(key) % self.slots
+        free = None
+        for step in range(self.slots):
+            index = (start + step) % self.slots
+            key_length, stored, _, _, _ = _SLOT.unpack_from(self.__map, self.__offset(index))
+            if key_length == _EMPTY:
+                return (free if free is not None else index,)
+            if key_length == _DELETED:
+                free = index if free is None else free
+            elif stored[:key_length] == key:
+                return index
+        return (free,) if free is not None else None
+
+    def __claim(self, index: int, key: bytes):
+        _SLOT.pack_into(self.__map, self.__offset(index), len(key), key, 0, 0, time.time())
+
+    def __evict(self, key: bytes):
+        """Give the least recently used slot nobody holds to the key, the header must be locked.
+
+        The slot is reused in place, never emptied, so the probe sequences
+        that go through it stay intact.
+        """
+        by_age = sorted(range(self.slots),
+                        key=lambda index: _SLOT.unpack_from(self.__map, self.__offset(index))[4])
+        for index in by_age:
+            with self.__slot_lock(index, blocking=False) as acquired:
+                if acquired:
+                    self.__claim(index, key)
+                    self.evictions += 1
+                    return index
+        raise RuntimeError("The session store is full")
+
+    @contextmanager
+    def __header_lock(self):
+        """Lock the header, it guards the creation of the store and slot claims."""
+        with self.__header_thread_lock:
+            self.__lock_range(0, _HEADER_SIZE)
+            try:
+                yield
+            finally:
+                self.__unlock_range(0, _HEADER_SIZE)
+
+    @contextmanager
+    def __slot_lock(self, index: int, blocking: bool = True):
+        """Lock a slot for this thread and this process, reentrant.
+
+        Yields:
+            bool: False if blocking is False and the slot is held, or is
+                already held by this thread.
+        """
+        thread_lock = self.__thread_locks[index % len(self.__thread_locks)]
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            depth = self.__depth.get(index, 0)
+            if depth and not blocking:
+                yield False
+                return
+            if depth == 0 and not self.__lock_range(self.__offset(index), self.slot_size, blocking):
+                yield False
+                return
+            self.__depth[index] = depth + 1
+            try:
+                yield True
+            finally:
+                self.__depth[index] = depth
+                if depth == 0:
+                    del self.__depth[index]
+                    self.__unlock_range(self.__offset(index), self.slot_size)
+        finally:
+            thread_lock.release()
+
+    def __lock_range(self, offset: int, length: int, blocking: bool = True):
+        """Lock a byte range of the file, returns False if it is held and blocking is False."""
+        try:
+            fcntl.lockf(self.__fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, length, offset)
+        except (BlockingIOError, PermissionError):
+            if blocking:
+                raise
+            return False
+        return True
+
+    def __unlock_range(self, offset: int, length: int):
+        fcntl.lockf(self.__fd, fcntl.LOCK_UN, length, offset)
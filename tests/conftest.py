@@ -0,0 +1,37 @@
+"""Test configuration.
+
+The project resolves its data files from the repository root (./src/...),
+so the tests run from there whatever the invocation directory is.
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+async def _connect(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    async def ask(payload):
+        line = payload if isinstance(payload, bytes) else json.dumps(payload).encode() + b"\n"
+        writer.write(line)
+        await writer.drain()
+        return json.loads(await reader.readline())
+    return reader, writer, ask
+
+
+@pytest.fixture
+def connect():
+    """Coroutine opening a client connection to a local ChatServer port.
+
+    It returns the reader, the writer and an ask(payload) coroutine that
+    sends one JSON line and returns the decoded answer.
+    """
+    return _connect
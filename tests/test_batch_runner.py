@@ -0,0 +1,84 @@
+"""Tests of the BatchRunner checkpoint and resume."""
+import json
+import threading
+import time
+
+import pytest
+
+from src import LOCALES
+from src.chat_modules.batch_runner import BatchRunner
+from src.chat_modules.chatbot_api import EchoChatBot
+
+
+class TriggerBot(EchoChatBot):
+    """Echo backend that stops or slows down on some messages."""
+
+    def __init__(self, interrupt=None, slow=None, delay=0.0):
+        super().__init__(LOCALES)
+        self.interrupt = interrupt
+        self.slow = slow
+        self.delay = delay
+
+    def chatbot_query(self, message):
+        last_line = message.splitlines()[-1]
+        if self.interrupt and self.interrupt in last_line:
+            raise KeyboardInterrupt
+        if self.slow and self.slow in last_line:
+            time.sleep(self.delay)
+        return super().chatbot_query(message)
+
+
+def write_sessions(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"session_id": f"s{i}", "turns": [f"hello {i}", f"bye {i}"]}) + "\n")
+            if i == 3:
+                f.write("\n")
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_interrupted_run_resumes_without_losing_or_repeating_lines(tmp_path):
+    source, output = str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")
+    write_sessions(source, 40)
+
+    with pytest.raises(KeyboardInterrupt):
+        BatchRunner(TriggerBot(interrupt="hello 25"), source, output, workers=4, report_every=0).run()
+    assert len(read_results(output)) < 40
+
+    report = BatchRunner(TriggerBot(), source, output, workers=4, report_every=0).run()
+    results = read_results(output)
+    assert sorted(result["line"] for result in results) == [i for i in range(41) if i != 4]
+    assert report.skipped > 0
+    assert all("replies" in result for result in results)
+
+
+def test_a_slow_line_does_not_grow_the_checkpoint(tmp_path):
+    source, output = str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl")
+    write_sessions(source, 200)
+    runner = BatchRunner(TriggerBot(slow="hello 0", delay=0.3), source, output, workers=4, report_every=0)
+
+    sizes = []
+    stop = threading.Event()
+
+    def watch_checkpoint():
+        while not stop.is_set():
+            try:
+                with open(runner.checkpoint_path) as f:
+                    sizes.append(len(json.load(f)["done"]))
+            except (OSError, ValueError):
+                pass
+            time.sleep(0.005)
+
+    watcher = threading.Thread(target=watch_checkpoint)
+    watcher.start()
+    try:
+        report = runner.run()
+    finally:
+        stop.set()
+        watcher.join()
+    assert report.sessions == 200
+    assert sizes and max(sizes) < 2 * 4
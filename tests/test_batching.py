@@ -0,0 +1,148 @@
+"""Tests of the MicroBatcher fan-out and the batched BLOOM queries."""
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+
+import pytest
+import requests
+
+from src import LOCALES
+from src.chat_modules import chatbot_api
+from src.chat_modules.batching import MicroBatcher
+from src.chat_modules.chatbot_api import BLOOMInferenceAPI
+
+
+def test_concurrent_prompts_are_batched_and_fanned_out():
+    batches = []
+
+    def batch_function(prompts):
+        batches.append(list(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+    batcher = MicroBatcher(batch_function, max_batch=8, max_wait=0.05)
+    with ThreadPoolExecutor(32) as executor:
+        replies = list(executor.map(batcher.submit, [f"p{i}" for i in range(64)]))
+    batcher.close()
+
+    assert replies == [f"P{i}" for i in range(64)]
+    assert sum(len(batch) for batch in batches) == 64
+    assert all(len(batch) <= 8 for batch in batches)
+    assert batcher.metrics.batches == len(batches) < 64
+    assert batcher.metrics.items == 64
+
+
+def test_batch_errors_reach_every_caller_and_the_worker_survives():
+    calls = []
+
+    def batch_function(prompts):
+        calls.append(prompts)
+        if len(calls) == 1:
+            raise KeyboardInterrupt
+        if len(calls) == 2:
+            return []
+        return prompts
+
+    batcher = MicroBatcher(batch_function, max_batch=4, max_wait=0)
+    with pytest.raises(KeyboardInterrupt):
+        batcher.submit("a")
+    with pytest.raises(ValueError):
+        batcher.submit("b")
+    assert batcher.submit("c") == "c"
+    batcher.close()
+
+
+def test_no_caller_waits_forever_around_close():
+    batcher = MicroBatcher(lambda prompts: prompts, max_batch=4, max_wait=0.001)
+    futures = []
+    rejected = []
+
+    def submitter():
+        for i in range(200):
+            try:
+                futures.append(batcher.submit_async(i))
+            except RuntimeError:
+                rejected.append(i)
+
+    threads = [threading.Thread(target=submitter) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    batcher.close()
+    for thread in threads:
+        thread.join()
+
+    _, pending = wait(futures, timeout=5)
+    assert not pending
+    assert len(futures) + len(rejected) == 800
+    with pytest.raises(RuntimeError):
+        batcher.submit("late")
+
+
+class FakeResponse:
+    def __init__(self, data=None, error=None):
+        self.data = data
+        self.error = error
+
+    def json(self):
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
+def mock_post(monkeypatch, reply):
+    """Route requests.post to reply(payload) and return the payloads sent."""
+    payloads = []
+
+    def post(url, headers=None, json=None, **kwargs):
+        payloads.append(json)
+        return reply(json)
+    monkeypatch.setattr(chatbot_api.requests, "post", post)
+    return payloads
+
+
+def test_bloom_single_query_sends_one_input(monkeypatch):
+    payloads = mock_post(monkeypatch, lambda payload: FakeResponse([{"generated_text": "Bot: hi"}]))
+    bot = BLOOMInferenceAPI("key", LOCALES)
+
+    assert bot.chatbot_query("Human: hello") == {"message": "Bot: hi"}
+    assert payloads[0]["inputs"] == "Human: hello"
+    assert payloads[0]["parameters"]["return_full_text"] is False
+
+
+@pytest.mark.parametrize("nested", [True, False])
+def test_bloom_batch_sends_a_list_and_keeps_the_order(monkeypatch, nested):
+    def reply(payload):
+        generations = [{"generated_text": f"Bot: {prompt}"} for prompt in payload["inputs"]]
+        return FakeResponse([[generation] for generation in generations] if nested else generations)
+    payloads = mock_post(monkeypatch, reply)
+    bot = BLOOMInferenceAPI("key", LOCALES)
+
+    replies = bot.chatbot_query_batch(["a", "b", "c"])
+    assert [reply["message"] for reply in replies] == ["Bot: a", "Bot: b", "Bot: c"]
+    assert len(payloads) == 1 and payloads[0]["inputs"] == ["a", "b", "c"]
+
+
+def test_bloom_concurrent_queries_share_requests(monkeypatch):
+    payloads = mock_post(monkeypatch, lambda payload: FakeResponse(
+        [[{"generated_text": f"Bot: {prompt}"}] for prompt in payload["inputs"]]
+        if isinstance(payload["inputs"], list) else [{"generated_text": f"Bot: {payload['inputs']}"}]))
+    bot = BLOOMInferenceAPI("key", LOCALES, batch_size=8, batch_wait=0.05)
+
+    with ThreadPoolExecutor(16) as executor:
+        replies = list(executor.map(bot.chatbot_query, [f"p{i}" for i in range(16)]))
+    bot.batcher.close()
+    assert [reply["message"] for reply in replies] == [f"Bot: p{i}" for i in range(16)]
+    assert len(payloads) < 16
+
+
+def test_bloom_api_errors_raise_connection_error(monkeypatch):
+    mock_post(monkeypatch, lambda payload: FakeResponse({"error": "Model is overloaded"}))
+    bot = BLOOMInferenceAPI("key", LOCALES)
+
+    with pytest.raises(ConnectionError, match="overloaded"):
+        bot.chatbot_query_batch(["a", "b"])
+
+
+def test_bloom_invalid_json_answers_the_error_message(monkeypatch):
+    mock_post(monkeypatch, lambda payload: FakeResponse(error=requests.JSONDecodeError("Expecting value", "", 0)))
+    bot = BLOOMInferenceAPI("key", LOCALES)
+
+    assert bot.chatbot_query_batch(["a", "b"]) == [{"message": LOCALES['api_error_message']}] * 2
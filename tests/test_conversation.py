@@ -0,0 +1,95 @@
+"""Tests of Conversation forking."""
+import tracemalloc
+
+import pytest
+
+from src import LOCALES, Conversation
+
+
+def make_conversation(turns=3, limit=100):
+    conversation = Conversation(LOCALES, limit=limit)
+    for i in range(turns):
+        conversation.add_human_message(f"h{i}")
+        conversation.add_ia_message(f"b{i}")
+    return conversation
+
+
+def test_branches_evolve_independently():
+    conversation = make_conversation()
+    shared = conversation.history
+    first = conversation.fork()
+    second = conversation.fork()
+    first.add_ia_message("first")
+    second.add_ia_message("second")
+    second.add_human_message("more")
+    conversation.add_human_message("root")
+
+    assert first.history == shared + [first.history[-1]]
+    assert first.history[-1].endswith("first")
+    assert second.history[-2].endswith("second")
+    assert second.history[-1].endswith("more")
+    assert conversation.history[-1].endswith("root")
+    assert conversation.history[:-1] == shared
+    assert conversation.make_prompt() == "\n".join(conversation.history)
+    assert second.make_prompt() == "\n".join(second.history)
+
+
+def test_commit_and_discard():
+    conversation = make_conversation()
+    branch = conversation.fork()
+    branch.add_ia_message("winner")
+    branch.commit()
+    assert conversation.history == branch.history
+
+    loser = conversation.fork()
+    loser.add_ia_message("loser")
+    loser.discard()
+    assert not conversation.history[-1].endswith("loser")
+    assert loser.parent is None
+
+
+def test_root_cannot_commit_or_discard():
+    conversation = make_conversation()
+    with pytest.raises(ValueError):
+        conversation.commit()
+    with pytest.raises(ValueError):
+        conversation.discard()
+    assert conversation.make_prompt().startswith(conversation.initial_story)
+
+
+def test_commit_of_a_stale_branch_raises():
+    conversation = make_conversation()
+    branch = conversation.fork()
+    conversation.add_human_message("next")
+    branch.add_ia_message("late")
+    with pytest.raises(ValueError):
+        branch.commit()
+    assert conversation.history[-1].endswith("next")
+
+
+def test_limit_discards_through_shared_segments():
+    conversation = make_conversation(turns=2, limit=6)
+    branch = conversation.fork()
+    conversation.add_ia_message("root")
+    for i in range(10):
+        branch.add_human_message(f"x{i}")
+        expected = branch.history
+        assert len(branch) == len(expected) <= 6
+    assert branch.history[-1].endswith("x9")
+    assert conversation.history[-1].endswith("root")
+
+
+def test_fork_memory_does_not_depend_on_history_length():
+    def fork_cost(turns):
+        conversation = make_conversation(turns=turns, limit=10 ** 6)
+        conversation.fork().add_ia_message("warm")
+        tracemalloc.start()
+        branches = [conversation.fork() for _ in range(50)]
+        for branch in branches:
+            branch.add_ia_message("divergent")
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size / 50
+
+    fork_cost(10)  # the first measure also pays for one-off interpreter allocations
+    assert fork_cost(10000) < fork_cost(10) * 1.5
@@ -0,0 +1,211 @@
+"""Tests of the ModuleCompiler pipelines and the ModuleManager hot reload."""
+import os
+import shutil
+import sys
+import textwrap
+import time
+import tracemalloc
+
+from src.chat_modules.module_models import ModuleCompiler, ModuleManager, _join_chunks
+
+PACKAGE = "test_user_modules"
+
+
+def write_module(root, name, description):
+    directory = os.path.join(root, PACKAGE, name)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "main.py"), "w") as f:
+        f.write(f'META_MODULE_NAME = "{name}"\n'
+                'META_MODULE_VERSION = "1.0"\n'
+                'META_AUTHOR = "tests"\n'
+                f'DESCRIPTION_PROMPT = "{description}"\n'
+                "def module_task_0(*args):\n    return args\n"
+                "module_task_0.priority = 0\n")
+
+
+def write_source(root, name, source):
+    directory = os.path.join(root, PACKAGE, name)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "main.py"), "w") as f:
+        f.write('META_MODULE_NAME = "%s"\nDESCRIPTION_PROMPT = "%s"\n' % (name, name))
+        f.write(textwrap.dedent(source))
+
+
+def isolate_package(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in [n for n in sys.modules if n.split(".")[0] == PACKAGE]:
+        monkeypatch.delitem(sys.modules, name)
+
+
+def make_compiler(tmp_path, monkeypatch, source):
+    isolate_package(tmp_path, monkeypatch)
+    write_source(str(tmp_path), "pipeline", source)
+    return ModuleCompiler("pipeline", package=PACKAGE)
+
+
+MIXED_STAGES = """
+    CALLS = []
+
+    def module_task_late(chunks):
+        for chunk in chunks:
+            CALLS.append("task_late")
+            yield f"<{chunk}>"
+    module_task_late.priority = 1
+
+    def module_task_early(chunks):
+        for chunk in chunks:
+            CALLS.append("task_early")
+            yield chunk
+    module_task_early.priority = 0
+
+    def module_preprocess_0(text):
+        CALLS.append("preprocess")
+        return text + "!"
+    module_preprocess_0.priority = 0
+
+    def module_feature_0(chunks):
+        for chunk in chunks:
+            CALLS.append("feature")
+            yield chunk.upper()
+    module_feature_0.priority = 0
+"""
+
+STREAMING_STAGES = """
+    def module_feature_0(chunks):
+        for chunk in chunks:
+            yield chunk.upper()
+    module_feature_0.priority = 0
+
+    def module_task_0(chunks):
+        for chunk in chunks:
+            yield chunk + "."
+    module_task_0.priority = 0
+"""
+
+
+def test_mixed_stages_run_in_priority_order(tmp_path, monkeypatch):
+    compiler = make_compiler(tmp_path, monkeypatch, MIXED_STAGES)
+    calls = sys.modules[f"{PACKAGE}.pipeline.main"].CALLS
+
+    assert compiler.execute_pipeline("ab") == "<AB!>"
+    assert calls == ["feature", "preprocess", "task_early", "task_late"]
+
+    calls.clear()
+    assert list(compiler.stream_pipeline(["a", "b"])) == ["<AB!>"]
+    # The whole value stage waits for every chunk of the streaming stage before it
+    assert calls == ["feature", "feature", "preprocess", "task_early", "task_late"]
+
+
+def test_streaming_stages_are_lazy_and_chunk_by_chunk(tmp_path, monkeypatch):
+    compiler = make_compiler(tmp_path, monkeypatch, STREAMING_STAGES)
+    produced = []
+
+    def source():
+        for chunk in ("a", "b", "c"):
+            produced.append(chunk)
+            yield chunk
+
+    stream = compiler.stream_pipeline(source())
+    assert produced == []
+    assert next(stream) == "A."
+    assert produced == ["a"]
+    assert list(stream) == ["B.", "C."]
+    assert compiler.execute_pipeline("x") == "X."
+
+
+def test_a_streaming_stage_that_yields_nothing_becomes_empty(tmp_path, monkeypatch):
+    compiler = make_compiler(tmp_path, monkeypatch, """
+        def module_feature_0(chunks):
+            for chunk in chunks:
+                if False:
+                    yield chunk
+        module_feature_0.priority = 0
+
+        def module_task_0(text):
+            return repr(text)
+        module_task_0.priority = 0
+    """)
+    assert _join_chunks([]) == ""
+    assert compiler.execute_pipeline("dropped") == "''"
+    assert list(compiler.stream_pipeline(["dropped"])) == ["''"]
+
+
+def test_join_chunks_keeps_mixed_types_as_a_list():
+    assert _join_chunks(["a", "b"]) == "ab"
+    assert _join_chunks([b"a", b"b"]) == b"ab"
+    assert _join_chunks([{"a": 1}]) == {"a": 1}
+    assert _join_chunks(["a", b"b", 1]) == ["a", b"b", 1]
+
+
+def test_streaming_memory_does_not_grow_with_the_input(tmp_path, monkeypatch):
+    compiler = make_compiler(tmp_path, monkeypatch, STREAMING_STAGES)
+
+    def peak(count):
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+        consumed = 0
+        for chunk in compiler.stream_pipeline(f"chunk {i}" for i in range(count)):
+            consumed += 1
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert consumed == count
+        return top - base
+
+    peak(10)
+    # 200k chunks are megabytes of text, only a few of them may be alive at once
+    assert peak(200000) < max(peak(1000) * 2, 16384)
+
+
+def make_manager(tmp_path, monkeypatch):
+    isolate_package(tmp_path, monkeypatch)
+    write_module(str(tmp_path), "first", "First module")
+    return ModuleManager(module_locations=str(tmp_path / PACKAGE), package=PACKAGE)
+
+
+def test_reload_picks_up_changed_and_new_modules(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    assert "First module" in manager.return_descriptions()[0]
+
+    write_module(str(tmp_path), "first", "Changed module")
+    write_module(str(tmp_path), "second", "Second module")
+    assert sorted(manager.reload_changed()) == ["first", "second"]
+    descriptions = manager.return_descriptions()[0]
+    assert "Changed module" in descriptions and "Second module" in descriptions
+    assert manager.reload_changed() == []
+
+
+def test_reload_ignores_stale_bytecode_of_a_same_size_edit(tmp_path, monkeypatch):
+    # The .pyc check only compares whole second mtimes and sizes, so this
+    # edit looks unchanged to the import system
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+    isolate_package(tmp_path, monkeypatch)
+    main_file = os.path.join(str(tmp_path), PACKAGE, "first", "main.py")
+    second = int(time.time()) - 10
+    write_module(str(tmp_path), "first", "AAAA")
+    os.utime(main_file, ns=(second * 10**9 + 100, second * 10**9 + 100))
+    manager = ModuleManager(module_locations=str(tmp_path / PACKAGE), package=PACKAGE)
+    assert os.path.isdir(os.path.join(os.path.dirname(main_file), "__pycache__"))
+
+    write_module(str(tmp_path), "first", "BBBB")
+    os.utime(main_file, ns=(second * 10**9 + 200, second * 10**9 + 200))
+    assert manager.reload_changed() == ["first"]
+    assert "BBBB" in manager.return_descriptions()[0]
+
+
+def test_watcher_records_scan_errors_and_recovers(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch)
+    moved = str(tmp_path / "moved")
+    os.rename(str(tmp_path / PACKAGE), moved)
+    manager.start_watching(0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while manager.watch_error is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert isinstance(manager.watch_error, OSError)
+
+        shutil.move(moved, str(tmp_path / PACKAGE))
+        while manager.watch_error is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert manager.watch_error is None
+    finally:
+        manager.stop_watching()
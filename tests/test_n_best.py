@@ -0,0 +1,120 @@
+"""Tests of the n-best turns of the chatbot managers."""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from src import LOCALES
+from src.chat_modules import chatbot_api
+from src.chat_modules.chatbot_api import BLOOMInferenceAPI, EchoChatBot
+from src.chat_modules.reranking import BaseReranker
+from src.i18n.i18n import I18nManager
+
+
+class ScriptedBot(EchoChatBot):
+    """Echo backend answering from a script and counting the queries in flight."""
+
+    def __init__(self, replies, locales=LOCALES, **kwargs):
+        super().__init__(locales, **kwargs)
+        self.replies = list(replies)
+        self.inflight = 0
+        self.peak = 0
+        self.__lock = threading.Lock()
+
+    def chatbot_query(self, message):
+        with self.__lock:
+            reply = self.replies.pop(0)
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        try:
+            time.sleep(0.01)
+            if isinstance(reply, Exception):
+                raise reply
+            return {"message": f"Bot: {reply}"}
+        finally:
+            with self.__lock:
+                self.inflight -= 1
+
+
+class FirstReranker(BaseReranker):
+    def score(self, candidate, prompt):
+        return 0
+
+
+def test_winner_is_counted_by_query_index():
+    # The first query fails, the first survivor is query 1 so the winner changed
+    bot = ScriptedBot([RuntimeError("down"), "a", "b"])
+    conversation = bot.new_conversation()
+
+    assert bot.generate("Hi", conversation, n_best=3, reranker=FirstReranker()) == "a"
+    assert bot.n_best_metrics.as_dict()["winner_changed"] == 1
+    assert bot.n_best_metrics.failed_candidates == 1
+
+
+def test_every_query_failing_commits_nothing():
+    bot = ScriptedBot([RuntimeError("down"), RuntimeError("down")])
+    conversation = bot.new_conversation()
+
+    history = list(conversation.history)
+    with pytest.raises(RuntimeError):
+        bot.generate("Hi", conversation, n_best=2)
+    assert conversation.history == history
+    assert bot.n_best_metrics.turns == 0
+
+
+def test_default_reranker_uses_the_conversation_locales():
+    # An English manager serving a Spanish session must still spot the Spanish role prefix
+    english = I18nManager("./src/i18n/strings.json", "en")
+    spanish = I18nManager("./src/i18n/strings.json", "es")
+    bot = ScriptedBot(["Humano: hola que tal", "hola que tal"], locales=english)
+    conversation = bot.new_conversation(spanish)
+
+    assert bot.generate("Hola", conversation, n_best=2) == "hola que tal"
+
+
+def test_candidate_queries_share_one_bounded_pool():
+    bot = ScriptedBot(["reply"] * 40, max_parallel_queries=3)
+    conversations = [bot.new_conversation() for _ in range(10)]
+
+    with ThreadPoolExecutor(10) as executor:
+        list(executor.map(lambda c: bot.generate("Hi", c, n_best=4), conversations))
+    assert bot.peak <= 3
+    assert bot.n_best_metrics.candidates == 40
+
+
+@pytest.mark.parametrize("batch_size", [None, 4])
+def test_bloom_candidates_sample_and_skip_the_cache(monkeypatch, batch_size):
+    payloads = []
+    lock = threading.Lock()
+
+    def post(url, headers=None, json=None, **kwargs):
+        with lock:
+            payloads.append(json)
+        inputs = json["inputs"] if isinstance(json["inputs"], list) else [json["inputs"]]
+
+        class Response:
+            def json(self):
+                generations = [[{"generated_text": f"Bot: reply {len(payloads)}-{i}"}] for i in range(len(inputs))]
+                return generations if isinstance(json["inputs"], list) else generations[0]
+        return Response()
+    monkeypatch.setattr(chatbot_api.requests, "post", post)
+    # The context discard of the second turn throttles itself
+    monkeypatch.setattr(chatbot_api, "sleep", lambda seconds: None)
+
+    bot = BLOOMInferenceAPI("key", LOCALES, batch_size=batch_size, batch_wait=0.05)
+    conversation = bot.new_conversation()
+    bot.generate("Hi", conversation, n_best=3)
+    candidate_payloads = list(payloads)
+    payloads.clear()
+    bot.generate("Again", conversation)
+    if batch_size:
+        bot.batcher.close()
+        bot.candidate_batcher.close()
+
+    assert sum(len(p["inputs"]) if isinstance(p["inputs"], list) else 1 for p in candidate_payloads) == 3
+    for payload in candidate_payloads:
+        assert payload["parameters"]["do_sample"] is True
+        assert payload["options"] == {"use_cache": False}
+    assert "do_sample" not in payloads[0]["parameters"]
+    assert "options" not in payloads[0]
@@ -0,0 +1,165 @@
+"""Localhost tests of the ChatServer against the EchoChatBot stub."""
+import asyncio
+import json
+import time
+
+from src import LOCALES
+from src.chat_modules.chatbot_api import EchoChatBot
+from src.chat_modules.server import ChatServer
+
+
+def run_server(scenario, chatbot=None, **server_options):
+    """Start a server on a free port, run the scenario and shut it down."""
+    async def main():
+        server = ChatServer(chatbot or EchoChatBot(LOCALES), LOCALES, port=0, **server_options)
+        _, port = await server.start()
+        try:
+            return await scenario(server, port)
+        finally:
+            await server.shutdown(timeout=2)
+    return asyncio.run(main())
+
+
+def test_hello_message_and_reset(connect):
+    async def scenario(server, port):
+        _, writer, ask = await connect(port)
+        hello = await ask({"type": "hello", "session_id": "s1", "locale": "en"})
+        first = await ask({"message": "one"})
+        second = await ask({"message": "two"})
+        history = list(server.get_session("s1").conversation.history)
+        reset = await ask({"type": "reset"})
+        after_reset = server.get_session("s1").conversation.history
+        writer.close()
+        return hello, first, second, history, reset, after_reset
+
+    hello, first, second, history, reset, after_reset = run_server(scenario)
+    assert hello["session_id"] == "s1"
+    assert hello["welcome"] == "Welcome to CliYouChat, How I can help you?"
+    assert first == {"session_id": "s1", "reply": "Human: : one"}
+    assert second["reply"] == "Human: : two"
+    assert len(history) == 5
+    assert reset == {"session_id": "s1", "reset": True}
+    assert len(after_reset) == 1
+
+
+def test_concurrent_sessions_are_isolated(connect):
+    async def client(port, i):
+        _, writer, ask = await connect(port)
+        await ask({"type": "hello", "session_id": f"s{i}"})
+        replies = [(await ask({"message": f"{i}-{turn}"}))["reply"] for turn in range(3)]
+        writer.close()
+        return replies
+
+    async def scenario(server, port):
+        return await asyncio.gather(*(client(port, i) for i in range(10)))
+
+    for i, replies in enumerate(run_server(scenario, max_inflight=3)):
+        assert replies == [f"Human: : {i}-{turn}" for turn in range(3)]
+
+
+def test_bad_input_gets_an_error_and_keeps_the_connection(connect):
+    async def scenario(server, port):
+        _, writer, ask = await connect(port)
+        answers = [
+            await ask(b"not json\n"),
+            await ask(b"[1, 2]\n"),
+            await ask({"type": "hello", "locale": "fr"}),
+            await ask({"type": "hello", "session_id": ["a"]}),
+            await ask({"type": "hello", "session_id": 7}),
+            await ask({"type": "nope"}),
+            await ask({"message": 5}),
+            await ask({"message": "still alive"}),
+        ]
+        writer.close()
+        return answers
+
+    answers = run_server(scenario)
+    for answer in answers[:5]:
+        assert answer["error"].startswith("bad request")
+    assert "unknown locale" in answers[2]["error"]
+    assert answers[5]["error"] == "unknown request type: nope"
+    assert answers[6]["error"] == "message must be a string"
+    assert answers[7]["reply"] == "Human: : still alive"
+
+
+def test_anonymous_sessions_are_dropped_with_their_connection(connect):
+    async def scenario(server, port):
+        for _ in range(5):
+            _, writer, ask = await connect(port)
+            await ask({"message": "hi"})
+            writer.write(b'{"type": "bye"}\n')
+            await writer.drain()
+            writer.close()
+        _, writer, ask = await connect(port)
+        await ask({"type": "hello", "session_id": "named"})
+        writer.close()
+        await asyncio.sleep(0.1)
+        return server.session_count()
+
+    assert run_server(scenario) == 1
+
+
+def test_sessions_are_capped_and_expire():
+    async def scenario(server, port):
+        for i in range(5):
+            server.get_session(f"s{i}")
+        capped = server.session_count()
+        server.session_ttl = 0
+        server.get_session("fresh")
+        return capped, server.session_count()
+
+    assert run_server(scenario, max_sessions=3) == (3, 1)
+
+
+def test_active_sessions_are_not_evicted_first(connect):
+    async def scenario(server, port):
+        _, active_writer, ask_active = await connect(port)
+        await ask_active({"type": "hello", "session_id": "active"})
+        _, idle_writer, ask_idle = await connect(port)
+        await ask_idle({"type": "hello", "session_id": "idle"})
+        await ask_active({"message": "still here"})
+        server.get_session("new")
+        active_writer.close()
+        idle_writer.close()
+        return len(server.get_session("active").conversation.history), server.session_count()
+
+    assert run_server(scenario, max_sessions=2) == (3, 2)
+
+
+def test_backend_errors_do_not_leak_to_clients(connect):
+    class FailingBot(EchoChatBot):
+        def chatbot_query(self, message):
+            raise RuntimeError("secret upstream detail")
+
+    async def scenario(server, port):
+        _, writer, ask = await connect(port)
+        answer = await ask({"message": "hi"})
+        writer.close()
+        return answer
+
+    answer = run_server(scenario, chatbot=FailingBot(LOCALES))
+    assert answer["error"] == LOCALES['api_error_message']
+    assert "secret" not in json.dumps(answer)
+
+
+def test_shutdown_does_not_wait_for_a_stuck_backend_past_the_timeout(connect):
+    async def scenario(server, port):
+        _, writer, _ = await connect(port)
+        writer.write(b'{"message": "hi"}\n')
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        start = time.monotonic()
+        await server.shutdown(timeout=0.2)
+        return time.monotonic() - start
+
+    assert run_server(scenario, chatbot=EchoChatBot(LOCALES, latency=1.0)) < 0.8
+
+
+def test_shutdown_closes_idle_connections(connect):
+    async def scenario(server, port):
+        reader, writer, ask = await connect(port)
+        await ask({"message": "hi"})
+        await server.shutdown(timeout=2)
+        return await reader.readline()
+
+    assert run_server(scenario) == b""
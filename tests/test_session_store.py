@@ -0,0 +1,151 @@
+"""Tests of the SharedSessionStore across instances and processes."""
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+
+from src import LOCALES
+from src.chat_modules.chatbot_api import EchoChatBot
+from src.chat_modules.server import ChatServer
+from src.chat_modules.session_store import SharedSessionStore
+
+
+def _increment(path, turns):
+    store = SharedSessionStore(path)
+    for turn in range(turns):
+        with store.lock("shared"):
+            history = store.load("shared") or []
+            store.save("shared", history + [f"{os.getpid()}-{turn}"])
+    store.close()
+
+
+def _churn(path, worker, rounds):
+    # More sessions than slots, so slots are evicted and reused under the other workers
+    store = SharedSessionStore(path, slots=8, slot_size=1024)
+    for turn in range(rounds):
+        session_id = f"s{(worker * 7 + turn) % 16}"
+        with store.lock(session_id):
+            history = store.load(session_id) or []
+            if any(not message.startswith(session_id + ":") for message in history):
+                os._exit(1)
+            store.save(session_id, history[-3:] + [f"{session_id}:{worker}-{turn}"])
+    store.close()
+    os._exit(0)
+
+
+def _run_processes(target, args_list):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    return [process.exitcode for process in processes]
+
+
+def test_instances_share_the_file(tmp_path):
+    path = str(tmp_path / "sessions")
+    first, second = SharedSessionStore(path, slots=16), SharedSessionStore(path)
+    first.save("a", ["prompt", "Human: hi"])
+    assert second.slots == 16
+    assert second.load("a") == ["prompt", "Human: hi"]
+    second.delete("a")
+    assert first.load("a") is None
+    first.close()
+    second.close()
+
+
+def test_turns_of_one_session_are_serialized_across_processes(tmp_path):
+    path = str(tmp_path / "sessions")
+    SharedSessionStore(path).close()
+    assert _run_processes(_increment, [(path, 25)] * 4) == [0] * 4
+
+    store = SharedSessionStore(path)
+    history = store.load("shared")
+    assert len(history) == len(set(history)) == 100
+    store.close()
+
+
+def test_sessions_never_read_another_session_under_eviction(tmp_path):
+    path = str(tmp_path / "sessions")
+    SharedSessionStore(path, slots=8, slot_size=1024).close()
+    assert _run_processes(_churn, [(path, worker, 2000) for worker in range(8)]) == [0] * 8
+
+
+def test_least_recently_used_sessions_are_evicted(tmp_path):
+    store = SharedSessionStore(str(tmp_path / "sessions"), slots=4, slot_size=256)
+    for i in range(10):
+        store.save(f"s{i}", [f"message {i}"])
+    assert [store.load(f"s{i}") is not None for i in range(10)] == [False] * 6 + [True] * 4
+    assert store.evictions == 6
+
+    # A session held for a turn is never evicted under its owner
+    with store.lock("held"):
+        for i in range(10, 20):
+            store.save(f"s{i}", ["message"])
+        store.save("held", ["still here"])
+    assert store.load("held") == ["still here"]
+    store.close()
+
+
+def test_store_rejects_long_ids_and_other_files(tmp_path):
+    store = SharedSessionStore(str(tmp_path / "sessions"))
+    with pytest.raises(ValueError):
+        store.save("x" * 63, ["prompt"])
+    store.close()
+    other = tmp_path / "other"
+    other.write_bytes(b"not a store" * 10)
+    with pytest.raises(ValueError):
+        SharedSessionStore(str(other))
+
+
+def test_reset_on_one_worker_reaches_the_others(tmp_path, connect):
+    path = str(tmp_path / "sessions")
+
+    async def main():
+        servers = [ChatServer(EchoChatBot(LOCALES), LOCALES, port=0,
+                              session_store=SharedSessionStore(path)) for _ in range(2)]
+        ports = [(await server.start())[1] for server in servers]
+        try:
+            (_, first, ask_first), (_, second, ask_second) = [await connect(port) for port in ports]
+            for ask in (ask_first, ask_second):
+                await ask({"type": "hello", "session_id": "s1"})
+            await ask_first({"message": "one"})
+            await ask_second({"message": "two"})
+            await ask_first({"type": "reset"})
+            await ask_second({"message": "three"})
+            first.close()
+            second.close()
+            return servers[0].session_store.load("s1")
+        finally:
+            for server in servers:
+                await server.shutdown(timeout=2)
+                server.session_store.close()
+
+    history = asyncio.run(main())
+    assert len(history) == 3
+    assert not any("one" in message or "two" in message for message in history)
+
+
+def test_servers_with_a_store_reject_ids_the_store_cannot_hold(tmp_path, connect):
+    async def main():
+        store = SharedSessionStore(str(tmp_path / "sessions"))
+        server = ChatServer(EchoChatBot(LOCALES), LOCALES, port=0, session_store=store)
+        _, port = await server.start()
+        try:
+            _, writer, ask = await connect(port)
+            answers = []
+            for session_id in ("x" * 64, "\u00e9" * 40, "y" * 62):
+                answers.append(await ask({"type": "hello", "session_id": session_id}))
+            answers.append(await ask({"message": "hi"}))
+            writer.close()
+            return answers
+        finally:
+            await server.shutdown(timeout=2)
+            store.close()
+
+    too_long, accented, longest, reply = asyncio.run(main())
+    assert too_long["error"].startswith("bad request") and accented["error"].startswith("bad request")
+    assert longest["session_id"] == "y" * 62
+    assert reply["reply"].endswith("hi")